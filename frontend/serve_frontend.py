@@ -5,7 +5,6 @@ This allows the frontend to make API calls to the microservices
 """
 
 import http.server
-import socketserver
 import os
 import sys
 from pathlib import Path
@@ -33,9 +32,20 @@ def main():
             # Handle preflight requests
             self.send_response(200)
             self.end_headers()
+        
+        def copyfile(self, source, outputfile):
+            # Send file bodies straight from the page cache to the socket with
+            # sendfile(2); socket.sendfile falls back to plain send() for
+            # in-memory bodies such as directory listings
+            if outputfile is self.wfile:
+                outputfile.flush()
+                self.connection.sendfile(source)
+            else:
+                super().copyfile(source, outputfile)
     
     try:
-        with socketserver.TCPServer(("", PORT), CustomHTTPRequestHandler) as httpd:
+        # One thread per connection so a slow client cannot stall other assets
+        with http.server.ThreadingHTTPServer(("", PORT), CustomHTTPRequestHandler) as httpd:
             script_dir = os.path.dirname(os.path.abspath(__file__))
             print(f"🌐 Frontend server started at http://localhost:{PORT}")
             print(f"📁 Serving files from: {script_dir}")
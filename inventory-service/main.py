@@ -1,18 +1,50 @@
 import os
-import json
-from datetime import datetime
-from typing import List, Dict, Any
+import time
+import queue
+import atexit
+import asyncio
+import functools
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
 
-import redis
-from fastapi import FastAPI, HTTPException
+import orjson
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError, ConnectionError as RedisConnectionError
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict
 
-# Import service discovery
-from service_discovery import initialize_service_discovery, get_service_url
+# Import product storage and service discovery
+from product_table import ProductTable
+from service_discovery import (
+    initialize_service_discovery,
+    get_service_ip,
+    start_service_discovery_refresh,
+    close_service_discovery
+)
+
+# Log records are written out by a background thread so handlers never block on stderr
+_log_queue = queue.SimpleQueue()
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "WARNING").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
+)
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+atexit.register(_log_listener.stop)
+logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
-app = FastAPI(title="Inventory Service", version="1.0.0")
+app = FastAPI(
+    title="Inventory Service",
+    version="1.0.0",
+    default_response_class=ORJSONResponse
+)
 
 # Add CORS middleware
 app.add_middleware(
@@ -23,6 +55,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger responses such as the product lists
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=5)
+
 # Service discovery initialization
 GITHUB_REPO_URL = os.getenv("GITHUB_REPO_URL", "https://github.com/RangaDM/cloud-components-config")
 SERVICE_NAME = os.getenv("SERVICE_NAME", "inventory-service")
@@ -31,77 +66,152 @@ SERVICE_IP = os.getenv("SERVICE_IP", "localhost")
 # Initialize service discovery
 try:
     initialize_service_discovery(GITHUB_REPO_URL, SERVICE_NAME, SERVICE_IP)
-    print(f"✅ Service discovery initialized for {SERVICE_NAME}")
+    logger.info("✅ Service discovery initialized for %s", SERVICE_NAME)
 except Exception as e:
-    print(f"⚠️ Failed to initialize service discovery: {e}")
+    logger.warning("⚠️ Failed to initialize service discovery: %s", e)
 
 # Redis connection for async communication
+@functools.lru_cache(maxsize=1)
 def get_redis_url():
-    """Get Redis URL from service discovery or environment variable"""
+    """
+    Get Redis URL from service discovery or environment variable
+    Cached; reconnect_redis() clears it to look the address up again
+    """
     try:
         # Try to get Redis IP from service discovery
-        print("🔍 DEBUG: Attempting to get Redis URL from service discovery...")
-        redis_service_url = get_service_url("redis", 6379)
-        print(f"🔍 DEBUG: Service discovery returned: {redis_service_url}")
+        logger.debug("🔍 Attempting to get Redis IP from service discovery...")
+        redis_ip = get_service_ip("redis")
+        logger.debug("🔍 Service discovery returned: %s", redis_ip)
         
-        if redis_service_url:
-            # Extract IP from the service URL and create Redis URL
-            from urllib.parse import urlparse
-            parsed_url = urlparse(redis_service_url)
-            redis_ip = parsed_url.hostname
+        if redis_ip:
             redis_url = f"redis://{redis_ip}:6379"
-            print(f"🔍 DEBUG: Using Redis URL from service discovery: {redis_url}")
+            logger.debug("🔍 Using Redis URL from service discovery: %s", redis_url)
             return redis_url
         else:
-            print("🔍 DEBUG: Service discovery returned None, using fallback")
+            logger.debug("🔍 Service discovery returned None, using fallback")
     except Exception as e:
-        print(f"⚠️ Failed to get Redis URL from service discovery: {e}")
+        logger.warning("⚠️ Failed to get Redis URL from service discovery: %s", e)
     
     # Fallback to environment variable
     fallback_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-    print(f"🔍 DEBUG: Using fallback Redis URL: {fallback_url}")
+    logger.debug("🔍 Using fallback Redis URL: %s", fallback_url)
     return fallback_url
 
-# Initialize Redis client after service discovery
-redis_client = redis.Redis.from_url(
-    get_redis_url(),
-    decode_responses=True
-)
+def create_redis_client(redis_url: str) -> aioredis.Redis:
+    """Create the Redis client; call from the running loop so its pool binds to it"""
+    return aioredis.from_url(
+        redis_url,
+        decode_responses=True,
+        max_connections=50
+    )
 
-# In-memory storage for products (in production, use a database)
-products_db = {
-    "prod001": {
+async def reconnect_redis():
+    """
+    Look the Redis address up again after a connection error
+    Switches to a new client only if the address changed; otherwise the
+    existing pool reconnects by itself on the next command
+    """
+    get_redis_url.cache_clear()
+    redis_url = get_redis_url()
+    if redis_url == app.state.redis_url:
+        return
+    
+    logger.warning("🔄 Redis address changed to %s, reconnecting", redis_url)
+    old_client = app.state.redis
+    app.state.redis = create_redis_client(redis_url)
+    app.state.redis_url = redis_url
+    await old_client.close()
+
+# Stock alerts are queued by the request path and added to the stream in pipelined batches
+NOTIFICATIONS_STREAM = "notifications"
+NOTIFICATIONS_STREAM_MAXLEN = 10000
+PUBLISH_BATCH_SIZE = 64
+PUBLISH_BATCH_WINDOW = 0.005  # seconds to wait for more alerts before flushing
+
+async def publish_alerts(batch: List[Dict[str, Any]]):
+    """Add a batch of alerts to the notifications stream in a single round-trip"""
+    try:
+        async with app.state.redis.pipeline(transaction=False) as pipe:
+            for alert_message in batch:
+                pipe.xadd(NOTIFICATIONS_STREAM, alert_message, maxlen=NOTIFICATIONS_STREAM_MAXLEN, approximate=True)
+            await pipe.execute()
+        logger.debug("✅ ASYNC: Published %d stock alert(s)", len(batch))
+    except Exception as e:
+        logger.warning("⚠️ ASYNC: Failed to publish %d stock alert(s): %s", len(batch), e)
+        if isinstance(e, RedisConnectionError):
+            await reconnect_redis()
+
+async def alert_publisher(queue: asyncio.Queue):
+    """
+    Background task that drains queued stock alerts
+    Flushes once PUBLISH_BATCH_SIZE alerts are collected or PUBLISH_BATCH_WINDOW elapses
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + PUBLISH_BATCH_WINDOW
+        while len(batch) < PUBLISH_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        await publish_alerts(batch)
+
+# Timestamp string shared by every request within the same wall-clock second
+_ts_cache = ["", 0]
+
+def now_iso() -> str:
+    """Current UTC time as an ISO 8601 string with one-second resolution"""
+    second = int(time.time())
+    if second != _ts_cache[1]:
+        _ts_cache[0] = datetime.fromtimestamp(second, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        _ts_cache[1] = second
+    return _ts_cache[0]
+
+# Seed catalogue
+SEED_PRODUCTS = [
+    {
         "product_id": "prod001",
         "name": "Laptop",
         "price": 999.99,
         "stock": 50,
         "category": "Electronics"
     },
-    "prod002": {
+    {
         "product_id": "prod002",
         "name": "Mouse",
         "price": 29.99,
         "stock": 100,
         "category": "Electronics"
     },
-    "prod003": {
+    {
         "product_id": "prod003",
         "name": "Keyboard",
         "price": 79.99,
         "stock": 75,
         "category": "Electronics"
     },
-    "prod004": {
+    {
         "product_id": "prod004",
         "name": "NoteBook",
         "price": 15,
         "stock": 1,
         "category": "Books"
     }
-}
+]
+
+# In-memory storage for products (in production, use a database)
+products_db = ProductTable()
+for _product in SEED_PRODUCTS:
+    products_db.add(_product, now_iso())
 
 # Pydantic models
 class Product(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+    
     product_id: str
     name: str
     price: float
@@ -111,6 +221,111 @@ class Product(BaseModel):
 class UpdateStockRequest(BaseModel):
     quantity: int
 
+def stock_key(product_id: str) -> str:
+    """Redis key holding the authoritative stock level of a product"""
+    return f"stock:{product_id}"
+
+# Applies a stock change (ARGV[2]) only if it leaves the level non-negative, atomically.
+# A missing key is seeded from ARGV[1] first, unless that is empty.
+# Returns {"ok", new level}, {"insufficient"} or {"missing"}.
+ADJUST_STOCK_SCRIPT = """
+local stock = redis.call("GET", KEYS[1])
+if not stock then
+    if ARGV[1] == "" then
+        return {"missing"}
+    end
+    redis.call("SET", KEYS[1], ARGV[1])
+    stock = ARGV[1]
+end
+if tonumber(stock) + tonumber(ARGV[2]) < 0 then
+    return {"insufficient"}
+end
+return {"ok", redis.call("INCRBY", KEYS[1], ARGV[2])}
+"""
+
+async def sync_stock_levels():
+    """
+    Seed Redis with the local stock levels of products it does not know yet,
+    then adopt the levels stored there so every worker starts from the same counts
+    """
+    product_ids = list(products_db.ids)
+    keys = [stock_key(product_id) for product_id in product_ids]
+    try:
+        async with app.state.redis.pipeline(transaction=False) as pipe:
+            for key, product_id in zip(keys, product_ids):
+                pipe.set(key, products_db.get_stock(product_id), nx=True)
+            pipe.mget(keys)
+            stored_levels = (await pipe.execute())[-1]
+    except RedisError as e:
+        logger.warning("⚠️ Failed to sync stock levels with Redis: %s", e)
+        return
+    
+    adopt_stock_levels(product_ids, stored_levels)
+
+def adopt_stock_levels(product_ids: List[str], stored_levels: List[Optional[str]]):
+    """
+    Copy stock levels read from Redis into the local product table
+    
+    Args:
+        product_ids: Products the levels were read for
+        stored_levels: Levels from Redis, None where a product has no key
+    """
+    for product_id, stock in zip(product_ids, stored_levels):
+        # Products may have been deleted while Redis was being read
+        if stock is None or product_id not in products_db:
+            continue
+        if int(stock) != products_db.get_stock(product_id):
+            products_db.set_stock(product_id, int(stock), products_db.get_updated_at(product_id))
+
+async def refresh_stock_levels(product_ids: List[str]):
+    """
+    Adopt the authoritative stock levels from Redis before serving products
+    With several workers, stock changes handled by the others only reach this
+    process through Redis; if Redis is unavailable the local levels are served
+    
+    Args:
+        product_ids: Products about to be returned
+    """
+    if not product_ids:
+        return
+    try:
+        stored_levels = await app.state.redis.mget([stock_key(product_id) for product_id in product_ids])
+    except RedisError as e:
+        logger.warning("⚠️ Failed to read stock levels from Redis: %s", e)
+        if isinstance(e, RedisConnectionError):
+            await reconnect_redis()
+        return
+    adopt_stock_levels(product_ids, stored_levels)
+
+@app.on_event("startup")
+async def startup_event():
+    """Connect to Redis and start the background tasks"""
+    start_service_discovery_refresh()
+    # Created on the running loop so the connection pool never blocks it
+    app.state.redis_url = get_redis_url()
+    app.state.redis = create_redis_client(app.state.redis_url)
+    app.state.adjust_stock = app.state.redis.register_script(ADJUST_STOCK_SCRIPT)
+    await sync_stock_levels()
+    app.state.alert_queue = asyncio.Queue()
+    app.state.alert_publisher = asyncio.create_task(alert_publisher(app.state.alert_queue))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the publisher, flush any alerts still queued and close outbound connections"""
+    app.state.alert_publisher.cancel()
+    try:
+        await app.state.alert_publisher
+    except asyncio.CancelledError:
+        pass
+    
+    queue = app.state.alert_queue
+    pending = [queue.get_nowait() for _ in range(queue.qsize())]
+    if pending:
+        await publish_alerts(pending)
+    
+    await app.state.redis.close()
+    await close_service_discovery()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -119,14 +334,18 @@ async def health_check():
 @app.get("/products")
 async def get_products():
     """Get all products"""
-    return {"products": list(products_db.values())}
+    await refresh_stock_levels(list(products_db.ids))
+    return Response(content=products_db.products_json(), media_type="application/json")
 
 @app.get("/products/{product_id}")
 async def get_product(product_id: str):
     """Get product by ID"""
     if product_id not in products_db:
         raise HTTPException(status_code=404, detail="Product not found")
-    return products_db[product_id]
+    await refresh_stock_levels([product_id])
+    if product_id not in products_db:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return Response(content=products_db.product_json(product_id), media_type="application/json")
 
 @app.put("/products/{product_id}/stock")
 async def update_stock(product_id: str, update_request: UpdateStockRequest):
@@ -138,59 +357,75 @@ async def update_stock(product_id: str, update_request: UpdateStockRequest):
     if product_id not in products_db:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    product = products_db[product_id]
-    new_stock = product["stock"] + update_request.quantity
+    # Redis holds the authoritative count, so concurrent workers cannot lose updates.
+    # The check and the change run as one script, so no other request sees a negative level.
+    key = stock_key(product_id)
+    try:
+        result = await app.state.adjust_stock(keys=[key], args=["", update_request.quantity], client=app.state.redis)
+        # The key is gone (e.g. Redis lost its data); re-seed it only while the product still exists
+        if result[0] == "missing" and product_id in products_db:
+            result = await app.state.adjust_stock(
+                keys=[key],
+                args=[products_db.get_stock(product_id), update_request.quantity],
+                client=app.state.redis
+            )
+            if product_id not in products_db:
+                # Deleted while the key was being seeded; do not leave it behind
+                await app.state.redis.delete(key)
+    except RedisError as e:
+        logger.warning("⚠️ Failed to update stock for %s in Redis: %s", product_id, e)
+        if isinstance(e, RedisConnectionError):
+            await reconnect_redis()
+        raise HTTPException(status_code=503, detail="Stock store unavailable")
     
-    if new_stock < 0:
+    # The product may have been deleted while Redis was being updated
+    if result[0] == "missing" or product_id not in products_db:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if result[0] == "insufficient":
         raise HTTPException(status_code=400, detail="Insufficient stock")
+    new_stock = result[1]
     
-    # Update stock
-    product["stock"] = new_stock
-    products_db[product_id] = product
+    products_db.set_stock(product_id, new_stock, now_iso())
+    product = products_db.get(product_id)
     
-    print(f"📦 Updated stock for {product_id}: {product['stock']} units")
+    logger.debug("📦 Updated stock for %s: %d units", product_id, new_stock)
     
     # Asynchronous communication - Check for low stock alerts
     if new_stock <= 10 and new_stock > 0:
-        print("⚠️ ASYNC: Sending low stock alert...")
+        logger.debug("⚠️ ASYNC: Sending low stock alert...")
         alert_message = {
             "type": "low_stock_alert",
             "product_id": product_id,
             "product_name": product["name"],
             "current_stock": new_stock,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now_iso()
         }
         
-        try:
-            # Publish to Redis queue for async processing
-            redis_client.publish("notifications", json.dumps(alert_message))
-            print("✅ ASYNC: Low stock alert queued")
-        except Exception as e:
-            print(f"⚠️ ASYNC: Failed to queue low stock alert: {e}")
+        # Queue for batched publishing to Redis
+        await app.state.alert_queue.put(alert_message)
+        logger.debug("✅ ASYNC: Low stock alert queued")
     
     # Asynchronous communication - Out of stock alert
     elif new_stock == 0:
-        print("🚨 ASYNC: Sending out of stock alert...")
+        logger.debug("🚨 ASYNC: Sending out of stock alert...")
         alert_message = {
             "type": "out_of_stock_alert",
             "product_id": product_id,
             "product_name": product["name"],
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now_iso()
         }
         
-        try:
-            # Publish to Redis queue for async processing
-            redis_client.publish("notifications", json.dumps(alert_message))
-            print("✅ ASYNC: Out of stock alert queued")
-        except Exception as e:
-            print(f"⚠️ ASYNC: Failed to queue out of stock alert: {e}")
-    
-    return {
+        # Queue for batched publishing to Redis
+        await app.state.alert_queue.put(alert_message)
+        logger.debug("✅ ASYNC: Out of stock alert queued")
+    
+    # Returned as a response object so FastAPI skips its jsonable_encoder pass
+    return ORJSONResponse({
         "product_id": product_id,
         "previous_stock": product["stock"] - update_request.quantity,
         "new_stock": product["stock"],
-        "updated_at": datetime.now().isoformat()
-    }
+        "updated_at": products_db.get_updated_at(product_id)
+    })
 
 @app.post("/products")
 async def create_product(product: Product):
@@ -198,8 +433,18 @@ async def create_product(product: Product):
     if product.product_id in products_db:
         raise HTTPException(status_code=400, detail="Product already exists")
     
-    products_db[product.product_id] = product.dict()
-    return product
+    # Dump and serialise once; the same bytes back this response and later reads
+    product_data = product.model_dump()
+    product_json = orjson.dumps(product_data)
+    try:
+        await app.state.redis.set(stock_key(product.product_id), product.stock)
+    except RedisError as e:
+        logger.warning("⚠️ Failed to store stock for %s in Redis: %s", product.product_id, e)
+        if isinstance(e, RedisConnectionError):
+            await reconnect_redis()
+        raise HTTPException(status_code=503, detail="Stock store unavailable")
+    products_db.add(product_data, now_iso(), product_json)
+    return Response(content=product_json, media_type="application/json")
 
 @app.delete("/products/{product_id}")
 async def delete_product(product_id: str):
@@ -207,32 +452,54 @@ async def delete_product(product_id: str):
     if product_id not in products_db:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    deleted_product = products_db.pop(product_id)
-    return {"message": f"Product {product_id} deleted", "product": deleted_product}
+    deleted_product = products_db.remove(product_id)
+    try:
+        await app.state.redis.delete(stock_key(product_id))
+    except RedisError as e:
+        logger.warning("⚠️ Failed to delete stock for %s from Redis: %s", product_id, e)
+        if isinstance(e, RedisConnectionError):
+            await reconnect_redis()
+    return ORJSONResponse({"message": f"Product {product_id} deleted", "product": deleted_product})
 
 @app.get("/products/{product_id}/stock")
 async def get_product_stock(product_id: str):
     """Get product stock level"""
+    if product_id not in products_db:
+        raise HTTPException(status_code=404, detail="Product not found")
+    await refresh_stock_levels([product_id])
     if product_id not in products_db:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    product = products_db[product_id]
-    return {
+    product = products_db.get(product_id)
+    return ORJSONResponse({
         "product_id": product_id,
         "product_name": product["name"],
         "stock": product["stock"],
-        "last_updated": datetime.now().isoformat()
-    }
+        "last_updated": products_db.get_updated_at(product_id)
+    })
 
 @app.get("/products/category/{category}")
 async def get_products_by_category(category: str):
     """Get products by category"""
-    filtered_products = [
-        product for product in products_db.values() 
-        if product["category"].lower() == category.lower()
-    ]
-    return {"products": filtered_products}
+    await refresh_stock_levels(products_db.filter_by_category(category))
+    return Response(
+        content=products_db.products_json(products_db.filter_by_category(category)),
+        media_type="application/json"
+    )
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8002) 
\ No newline at end of file
+    # Product data lives in process memory, so extra workers are opt-in via WORKERS
+    workers = int(os.getenv("WORKERS", "1"))
+    # Workers must import the app themselves; a single process serves this
+    # module's app directly so the module is not imported a second time
+    uvicorn.run(
+        "main:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=8002,
+        loop="uvloop",
+        http="httptools",
+        workers=workers,
+        limit_concurrency=1000,
+        timeout_keep_alive=30
+    )
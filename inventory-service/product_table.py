@@ -0,0 +1,191 @@
+from array import array
+from typing import Any, Dict, Iterable, List, Optional
+
+import orjson
+
+class ProductTable:
+    """
+    In-memory product store laid out as parallel columns (structure of arrays).
+    
+    Every product occupies one row across the columns. Stock and price are kept
+    in typed arrays, categories are lowercased once on insert, and each row
+    carries its pre-serialised JSON payload, which is only rebuilt when the
+    row changes.
+    """
+    
+    def __init__(self):
+        """
+        Initialize an empty product table
+        """
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self.prices = array("d")
+        self.stocks = array("q")
+        self.categories: List[str] = []
+        self.categories_lc: List[str] = []
+        self.updated_at: List[str] = []
+        self._payloads: List[bytes] = []
+        self._rows: Dict[str, int] = {}
+        # Lowercase category -> product IDs, in insertion order
+        self._by_category: Dict[str, Dict[str, None]] = {}
+        self._all_json: Optional[bytes] = None
+    
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self._rows
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def _row_dict(self, row: int) -> Dict[str, Any]:
+        return {
+            "product_id": self.ids[row],
+            "name": self.names[row],
+            "price": self.prices[row],
+            "stock": self.stocks[row],
+            "category": self.categories[row]
+        }
+    
+    def add(self, product: Dict[str, Any], updated_at: str, payload: Optional[bytes] = None):
+        """
+        Append a product as a new row
+        
+        Args:
+            product: Product fields (product_id, name, price, stock, category)
+            updated_at: Timestamp recorded as the product's last write
+            payload: Pre-serialised JSON of the product, if the caller already has it
+        """
+        product_id = product["product_id"]
+        category_lc = product["category"].lower()
+        
+        self._rows[product_id] = len(self.ids)
+        self.ids.append(product_id)
+        self.names.append(product["name"])
+        self.prices.append(product["price"])
+        self.stocks.append(product["stock"])
+        self.categories.append(product["category"])
+        self.categories_lc.append(category_lc)
+        self.updated_at.append(updated_at)
+        self._payloads.append(payload if payload is not None else orjson.dumps(self._row_dict(len(self.ids) - 1)))
+        self._by_category.setdefault(category_lc, {})[product_id] = None
+        self._all_json = None
+    
+    def remove(self, product_id: str) -> Dict[str, Any]:
+        """
+        Delete a product, keeping the remaining rows in insertion order
+        
+        Args:
+            product_id: ID of the product to delete
+        
+        Returns:
+            The deleted product as a dictionary
+        """
+        row = self._rows.pop(product_id)
+        product = self._row_dict(row)
+        
+        category_lc = self.categories_lc[row]
+        del self._by_category[category_lc][product_id]
+        if not self._by_category[category_lc]:
+            del self._by_category[category_lc]
+        
+        for column in (self.ids, self.names, self.prices, self.stocks,
+                       self.categories, self.categories_lc, self.updated_at, self._payloads):
+            del column[row]
+        for shifted_row in range(row, len(self.ids)):
+            self._rows[self.ids[shifted_row]] = shifted_row
+        
+        self._all_json = None
+        return product
+    
+    def get(self, product_id: str) -> Dict[str, Any]:
+        """
+        Get a product as a dictionary
+        
+        Args:
+            product_id: ID of the product
+        
+        Returns:
+            Product fields (product_id, name, price, stock, category)
+        """
+        return self._row_dict(self._rows[product_id])
+    
+    def get_stock(self, product_id: str) -> int:
+        """
+        Get the current stock level of a product
+        
+        Args:
+            product_id: ID of the product
+        
+        Returns:
+            Units in stock
+        """
+        return self.stocks[self._rows[product_id]]
+    
+    def get_updated_at(self, product_id: str) -> str:
+        """
+        Get the time of the last write to a product
+        
+        Args:
+            product_id: ID of the product
+        
+        Returns:
+            Timestamp passed to the last add/stock update
+        """
+        return self.updated_at[self._rows[product_id]]
+    
+    def set_stock(self, product_id: str, stock: int, updated_at: str):
+        """
+        Overwrite the stock level of a product and refresh its payload
+        
+        Args:
+            product_id: ID of the product
+            stock: New stock level
+            updated_at: Timestamp recorded as the product's last write
+        """
+        row = self._rows[product_id]
+        self.stocks[row] = stock
+        self.updated_at[row] = updated_at
+        self._payloads[row] = orjson.dumps(self._row_dict(row))
+        self._all_json = None
+    
+    def filter_by_category(self, category: str) -> List[str]:
+        """
+        Get the products in a category, matched case-insensitively
+        
+        Args:
+            category: Category name
+        
+        Returns:
+            Product IDs in insertion order
+        """
+        return list(self._by_category.get(category.lower(), ()))
+    
+    def product_json(self, product_id: str) -> bytes:
+        """
+        Get the serialised JSON of a single product
+        
+        Args:
+            product_id: ID of the product
+        
+        Returns:
+            JSON object bytes
+        """
+        return self._payloads[self._rows[product_id]]
+    
+    def products_json(self, product_ids: Optional[Iterable[str]] = None) -> bytes:
+        """
+        Build a {"products": [...]} body from the per-row payloads
+        
+        Args:
+            product_ids: Products to include (all products if omitted)
+        
+        Returns:
+            JSON object bytes
+        """
+        if product_ids is None:
+            if self._all_json is None:
+                self._all_json = b'{"products":[' + b",".join(self._payloads) + b"]}"
+            return self._all_json
+        
+        payloads = self._payloads
+        rows = self._rows
+        return b'{"products":[' + b",".join([payloads[rows[product_id]] for product_id in product_ids]) + b"]}"
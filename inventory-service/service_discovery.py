@@ -1,9 +1,21 @@
 import os
 import json
+import asyncio
+import functools
+import logging
 import httpx
+import random
 import time
-from typing import Dict, Optional
-from urllib.parse import urlparse
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Outbound HTTP client shared by service discovery, so connections are reused across refreshes
+_http_client = httpx.AsyncClient(
+    http2=True,
+    timeout=10.0,
+    limits=httpx.Limits(max_keepalive_connections=10)
+)
 
 class ServiceDiscovery:
     """
@@ -11,7 +23,16 @@ class ServiceDiscovery:
     and provides dynamic service URLs for inter-service communication.
     """
     
-    def __init__(self, github_repo_url: str, service_name: str, service_ip: str):
+    # Ports used when a lookup does not specify one
+    _DEFAULT_PORTS = {
+        "order-service": 8001,
+        "inventory-service": 8002,
+        "notification-service": 8003,
+        "frontend": 8080
+    }
+    
+    def __init__(self, github_repo_url: str, service_name: str, service_ip: str,
+                 http_client: Optional[httpx.AsyncClient] = None):
         """
         Initialize service discovery
         
@@ -19,6 +40,7 @@ class ServiceDiscovery:
             github_repo_url: GitHub repository URL containing service configuration file
             service_name: Name of the current service (e.g., 'order-service')
             service_ip: IP address of the current service
+            http_client: Shared client for outbound requests (defaults to the module client)
         """
         self.github_repo_url = github_repo_url
         self.service_name = service_name
@@ -26,6 +48,14 @@ class ServiceDiscovery:
         self.service_configs = {}
         self.last_update = 0
         self.update_interval = 300  # Update every 5 minutes
+        # Resolved URLs per (service_name, port); cleared whenever service_configs changes
+        self._url_cache: Dict[Tuple[str, int], str] = {}
+        self._client = http_client or _http_client
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._raw_url = self._get_raw_github_url()
+        # Validators from the last successful fetch, sent back to get 304 Not Modified
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
         
     def _get_raw_github_url(self, file_path: str = "service_config.json") -> str:
         """
@@ -48,66 +78,148 @@ class ServiceDiscovery:
             # Assume it's already a raw URL
             return self.github_repo_url
     
-    def _fetch_service_configs(self) -> Dict[str, str]:
+    def _conditional_headers(self) -> Dict[str, str]:
+        """
+        Build cache validation headers for the configuration request
+        
+        Returns:
+            If-None-Match / If-Modified-Since headers from the previous response
+        """
+        headers = {}
+        if self._etag:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified:
+            headers["If-Modified-Since"] = self._last_modified
+        return headers
+    
+    def _parse_service_configs(self, response: httpx.Response) -> Dict[str, str]:
+        """
+        Extract service configurations from a GitHub response
+        
+        Args:
+            response: Response for the raw configuration file
+            
+        Returns:
+            Dictionary mapping service names to their IP addresses
+        """
+        if response.status_code == 304:
+            logger.debug("✅ Service configs not modified")
+            # Unchanged upstream: hand back the current configs so they are kept and re-stamped
+            return self.service_configs
+        elif response.status_code == 200:
+            config_data = response.json()
+            self._etag = response.headers.get("ETag")
+            self._last_modified = response.headers.get("Last-Modified")
+            logger.info("✅ Successfully fetched service configs: %s", config_data)
+            return config_data
+        else:
+            logger.error("❌ Failed to fetch service configs. Status: %s", response.status_code)
+            return {}
+    
+    async def _fetch_service_configs_async(self) -> Dict[str, str]:
         """
-        Fetch service configurations from GitHub repository
+        Fetch service configurations from GitHub repository without blocking the event loop
         
         Returns:
             Dictionary mapping service names to their IP addresses
         """
         try:
-            raw_url = self._get_raw_github_url()
-            print(f"🔍 Fetching service configs from: {raw_url}")
-            
-            async def fetch():
-                async with httpx.AsyncClient(timeout=10.0) as client:
-                    response = await client.get(raw_url)
-                    if response.status_code == 200:
-                        config_data = response.json()
-                        print(f"✅ Successfully fetched service configs: {config_data}")
-                        return config_data
-                    else:
-                        print(f"❌ Failed to fetch service configs. Status: {response.status_code}")
-                        return {}
-            
-            # For synchronous usage, we'll use a simple approach
-            import requests
-            response = requests.get(raw_url, timeout=10)
-            if response.status_code == 200:
-                config_data = response.json()
-                print(f"✅ Successfully fetched service configs: {config_data}")
-                return config_data
-            else:
-                print(f"❌ Failed to fetch service configs. Status: {response.status_code}")
-                return {}
-                
+            logger.debug("🔍 Fetching service configs from: %s", self._raw_url)
+            response = await self._client.get(self._raw_url, headers=self._conditional_headers())
+            return self._parse_service_configs(response)
+        except Exception as e:
+            logger.error("❌ Error fetching service configs: %s", e)
+            return {}
+    
+    def _fetch_service_configs_sync(self) -> Dict[str, str]:
+        """
+        Fetch service configurations from GitHub repository when no event loop is running
+        
+        Uses a short-lived client so that no pooled connection outlives the
+        caller; the shared async client is reserved for the application loop.
+        
+        Returns:
+            Dictionary mapping service names to their IP addresses
+        """
+        try:
+            logger.debug("🔍 Fetching service configs from: %s", self._raw_url)
+            with httpx.Client(timeout=10.0) as client:
+                response = client.get(self._raw_url, headers=self._conditional_headers())
+            return self._parse_service_configs(response)
         except Exception as e:
-            print(f"❌ Error fetching service configs: {e}")
+            logger.error("❌ Error fetching service configs: %s", e)
             return {}
     
+    def _apply_service_configs(self, new_configs: Dict[str, str], current_time: float):
+        """
+        Store freshly fetched service configurations
+        
+        Args:
+            new_configs: Configurations returned by a fetch (empty on failure)
+            current_time: Time at which the fetch was started
+        """
+        # Only update if we got valid configs from GitHub
+        if new_configs:
+            self.service_configs = new_configs
+            self.last_update = current_time
+            self._url_cache = {}
+            
+            # Register current service
+            if self.service_name not in self.service_configs:
+                self.service_configs[self.service_name] = self.service_ip
+                logger.info("📝 Registered current service: %s -> %s", self.service_name, self.service_ip)
+        else:
+            # If GitHub fetch failed, keep existing configs and just register current service
+            if self.service_name not in self.service_configs:
+                self.service_configs[self.service_name] = self.service_ip
+                logger.info("📝 Registered current service: %s -> %s", self.service_name, self.service_ip)
+    
+    async def _update_service_configs_async(self):
+        """
+        Fetch and store service configurations on the running event loop
+        """
+        logger.debug("🔄 Updating service configurations...")
+        current_time = time.time()
+        self._apply_service_configs(await self._fetch_service_configs_async(), current_time)
+    
     def _update_service_configs(self):
         """
-        Update service configurations if enough time has passed
+        Fetch and store service configurations before the event loop is running
         """
+        logger.debug("🔄 Updating service configurations...")
         current_time = time.time()
-        if current_time - self.last_update > self.update_interval:
-            print("🔄 Updating service configurations...")
-            new_configs = self._fetch_service_configs()
-            
-            # Only update if we got valid configs from GitHub
-            if new_configs:
-                self.service_configs = new_configs
-                self.last_update = current_time
-                
-                # Register current service
-                if self.service_name not in self.service_configs:
-                    self.service_configs[self.service_name] = self.service_ip
-                    print(f"📝 Registered current service: {self.service_name} -> {self.service_ip}")
-            else:
-                # If GitHub fetch failed, keep existing configs and just register current service
-                if self.service_name not in self.service_configs:
-                    self.service_configs[self.service_name] = self.service_ip
-                    print(f"📝 Registered current service: {self.service_name} -> {self.service_ip}")
+        self._apply_service_configs(self._fetch_service_configs_sync(), current_time)
+    
+    async def _refresh_loop(self):
+        """
+        Refresh service configurations in the background every update_interval
+        
+        The delay is jittered by up to 30 seconds so replicas do not hit GitHub
+        in lockstep; lookups never wait on a refresh.
+        """
+        while True:
+            await asyncio.sleep(max(0.0, self.update_interval + random.uniform(-30, 30)))
+            await self._update_service_configs_async()
+            invalidate()
+    
+    def start_refresh(self):
+        """
+        Start the background refresh task on the running event loop
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_loop())
+    
+    async def stop_refresh(self):
+        """
+        Cancel the background refresh task
+        """
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
     
     def get_service_url(self, service_name: str, port: int = None) -> Optional[str]:
         """
@@ -120,28 +232,33 @@ class ServiceDiscovery:
         Returns:
             Service URL or None if service not found
         """
-        self._update_service_configs()
+        # Use default ports if not specified
+        if port is None:
+            port = self._DEFAULT_PORTS.get(service_name, 8000)
+        
+        key = (service_name, port)
+        if key in self._url_cache:
+            return self._url_cache[key]
         
         if service_name not in self.service_configs:
-            print(f"⚠️ Service '{service_name}' not found in configuration")
             return None
         
-        service_ip = self.service_configs[service_name]
-        
-        # Use default ports if not specified
-        if port is None:
-            default_ports = {
-                "order-service": 8001,
-                "inventory-service": 8002,
-                "notification-service": 8003,
-                "frontend": 8080
-            }
-            port = default_ports.get(service_name, 8000)
-        
-        service_url = f"http://{service_ip}:{port}"
-        print(f"🔗 Service URL for {service_name}: {service_url}")
+        service_url = f"http://{self.service_configs[service_name]}:{port}"
+        self._url_cache[key] = service_url
         return service_url
     
+    def get_service_ip(self, service_name: str) -> Optional[str]:
+        """
+        Get the raw IP address registered for a service
+        
+        Args:
+            service_name: Name of the service
+            
+        Returns:
+            Service IP or None if service not found
+        """
+        return self.service_configs.get(service_name)
+    
     def get_all_service_urls(self) -> Dict[str, str]:
         """
         Get URLs for all known services
@@ -149,13 +266,10 @@ class ServiceDiscovery:
         Returns:
             Dictionary mapping service names to their URLs
         """
-        self._update_service_configs()
-        
-        service_urls = {}
-        for service_name in self.service_configs:
-            service_urls[service_name] = self.get_service_url(service_name)
-        
-        return service_urls
+        return {
+            service_name: f"http://{service_ip}:{self._DEFAULT_PORTS.get(service_name, 8000)}"
+            for service_name, service_ip in self.service_configs.items()
+        }
     
     def register_service(self, service_name: str, service_ip: str):
         """
@@ -166,7 +280,9 @@ class ServiceDiscovery:
             service_ip: IP address of the service
         """
         self.service_configs[service_name] = service_ip
-        print(f"📝 Registered service: {service_name} -> {service_ip}")
+        self._url_cache = {}
+        invalidate()
+        logger.info("📝 Registered service: %s -> %s", service_name, service_ip)
     
     def get_current_service_info(self) -> Dict[str, str]:
         """
@@ -194,13 +310,29 @@ def initialize_service_discovery(github_repo_url: str, service_name: str, servic
         service_ip: IP address of the current service
     """
     global _service_discovery
-    _service_discovery = ServiceDiscovery(github_repo_url, service_name, service_ip)
-    print(f"🚀 Service discovery initialized for {service_name} at {service_ip}")
+    _service_discovery = ServiceDiscovery(github_repo_url, service_name, service_ip, _http_client)
+    invalidate()
+    # Load the registry up front; afterwards it is refreshed by the background task
+    _service_discovery._update_service_configs()
+    logger.info("🚀 Service discovery initialized for %s at %s", service_name, service_ip)
+
+@functools.lru_cache(maxsize=64)
+def _cached_service_url(service_name: str, port: Optional[int]) -> Optional[str]:
+    return _service_discovery.get_service_url(service_name, port)
+
+def invalidate():
+    """
+    Drop all memoized service URLs so the next lookup goes back to the registry
+    """
+    _cached_service_url.cache_clear()
 
 def get_service_url(service_name: str, port: int = None) -> Optional[str]:
     """
     Get service URL using the global service discovery instance
     
+    Lookups are memoized per (service_name, port) until the registry is
+    refreshed or invalidate() is called.
+    
     Args:
         service_name: Name of the service to get URL for
         port: Port number (optional)
@@ -211,7 +343,22 @@ def get_service_url(service_name: str, port: int = None) -> Optional[str]:
     if _service_discovery is None:
         raise RuntimeError("Service discovery not initialized. Call initialize_service_discovery() first.")
     
-    return _service_discovery.get_service_url(service_name, port)
+    return _cached_service_url(service_name, port)
+
+def get_service_ip(service_name: str) -> Optional[str]:
+    """
+    Get a service's IP address using the global service discovery instance
+    
+    Args:
+        service_name: Name of the service
+        
+    Returns:
+        Service IP or None if service not found
+    """
+    if _service_discovery is None:
+        raise RuntimeError("Service discovery not initialized. Call initialize_service_discovery() first.")
+    
+    return _service_discovery.get_service_ip(service_name)
 
 def get_all_service_urls() -> Dict[str, str]:
     """
@@ -223,4 +370,21 @@ def get_all_service_urls() -> Dict[str, str]:
     if _service_discovery is None:
         raise RuntimeError("Service discovery not initialized. Call initialize_service_discovery() first.")
     
-    return _service_discovery.get_all_service_urls() 
\ No newline at end of file
+    return _service_discovery.get_all_service_urls()
+
+def start_service_discovery_refresh():
+    """
+    Start refreshing the global registry in the background; call from the application's startup hook
+    """
+    if _service_discovery is None:
+        raise RuntimeError("Service discovery not initialized. Call initialize_service_discovery() first.")
+    
+    _service_discovery.start_refresh()
+
+async def close_service_discovery():
+    """
+    Stop the background refresh and close the shared HTTP client; call from the application's shutdown hook
+    """
+    if _service_discovery is not None:
+        await _service_discovery.stop_refresh()
+    await _http_client.aclose()
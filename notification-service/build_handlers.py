@@ -0,0 +1,19 @@
+"""
+Compile handlers.py with Cython in pure-Python mode
+
+Usage:
+    python build_handlers.py build_ext --inplace
+
+The compiled module is picked up ahead of handlers.py when present; without it
+the service runs the plain Python source unchanged.
+"""
+from setuptools import setup, Extension
+from Cython.Build import cythonize
+
+setup(
+    name="notification-handlers",
+    ext_modules=cythonize(
+        [Extension("handlers", ["handlers.py"], extra_compile_args=["-O3"])],
+        compiler_directives={"language_level": 3}
+    )
+)
@@ -0,0 +1,85 @@
+import uuid
+import base64
+from datetime import datetime
+from typing import Any, Callable, Dict
+
+ADMIN_RECIPIENT = "admin@company.com"
+
+# Message templates, bound once so each call is a single format() call
+ORDER_CONFIRMATION_MESSAGE = "Order {} confirmed! Total: ${:.2f}".format
+LOW_STOCK_MESSAGE = "Low stock alert: {} ({}) - Only {} units remaining".format
+OUT_OF_STOCK_MESSAGE = "Out of stock alert: {} ({}) - No units remaining".format
+
+def new_notification_id() -> str:
+    """Random notification ID: a UUID4 as 22 URL-safe base64 characters"""
+    return base64.urlsafe_b64encode(uuid.uuid4().bytes).rstrip(b"=").decode()
+
+def create_notification(notification_type: str, message: str, recipient: str) -> Dict[str, Any]:
+    """
+    Helper function to create a notification
+    Builds the stored dictionary directly; the Notification model is only used for API responses
+    """
+    return {
+        "notification_id": new_notification_id(),
+        "type": notification_type,
+        "message": message,
+        "recipient": recipient,
+        "timestamp": datetime.now(),
+        "status": "sent"
+    }
+
+def handle_order_confirmation(notification_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the notification sent to a user when their order is confirmed
+    
+    Args:
+        notification_data: Message with order_id, user_id and total_amount
+    
+    Returns:
+        Notification dictionary ready to store
+    """
+    message = ORDER_CONFIRMATION_MESSAGE(
+        notification_data.get("order_id"),
+        float(notification_data.get("total_amount"))
+    )
+    return create_notification("order_confirmation", message, notification_data.get("user_id"))
+
+def handle_low_stock_alert(notification_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the admin alert sent when a product is running low
+    
+    Args:
+        notification_data: Message with product_id, product_name and current_stock
+    
+    Returns:
+        Notification dictionary ready to store
+    """
+    message = LOW_STOCK_MESSAGE(
+        notification_data.get("product_name"),
+        notification_data.get("product_id"),
+        notification_data.get("current_stock")
+    )
+    return create_notification("low_stock_alert", message, ADMIN_RECIPIENT)
+
+def handle_out_of_stock_alert(notification_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the admin alert sent when a product runs out
+    
+    Args:
+        notification_data: Message with product_id and product_name
+    
+    Returns:
+        Notification dictionary ready to store
+    """
+    message = OUT_OF_STOCK_MESSAGE(
+        notification_data.get("product_name"),
+        notification_data.get("product_id")
+    )
+    return create_notification("out_of_stock_alert", message, ADMIN_RECIPIENT)
+
+# Message type -> builder for the notification to store
+HANDLERS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "order_confirmation": handle_order_confirmation,
+    "low_stock_alert": handle_low_stock_alert,
+    "out_of_stock_alert": handle_out_of_stock_alert,
+}
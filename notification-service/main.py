@@ -1,20 +1,45 @@
 import os
-import json
-import threading
 import time
+import queue
+import atexit
+import asyncio
+import functools
+import logging
+import logging.handlers
 from datetime import datetime
 from typing import List, Dict, Any
 
-import redis
+import orjson
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError, ConnectionError as RedisConnectionError
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
-# Import service discovery
-from service_discovery import initialize_service_discovery, get_service_url
+# Import notification handlers and service discovery
+from handlers import HANDLERS, create_notification
+from service_discovery import (
+    initialize_service_discovery,
+    get_service_ip,
+    start_service_discovery_refresh,
+    close_service_discovery
+)
+
+# Log records are written out by a background thread so handlers never block on stderr
+_log_queue = queue.SimpleQueue()
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "WARNING").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
+)
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+atexit.register(_log_listener.stop)
+logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
-app = FastAPI(title="Notification Service", version="1.0.0")
+app = FastAPI(title="Notification Service", version="1.0.0", default_response_class=ORJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -33,45 +58,81 @@ SERVICE_IP = os.getenv("SERVICE_IP", "localhost")
 # Initialize service discovery
 try:
     initialize_service_discovery(GITHUB_REPO_URL, SERVICE_NAME, SERVICE_IP)
-    print(f"✅ Service discovery initialized for {SERVICE_NAME}")
+    logger.info("✅ Service discovery initialized for %s", SERVICE_NAME)
 except Exception as e:
-    print(f"⚠️ Failed to initialize service discovery: {e}")
+    logger.warning("⚠️ Failed to initialize service discovery: %s", e)
 
 # Redis connection for async communication
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+
+@functools.lru_cache(maxsize=1)
 def get_redis_url():
-    """Get Redis URL from service discovery or environment variable"""
+    """
+    Get Redis URL from service discovery or environment variable
+    Cached; reconnect_redis() clears it to look the address up again
+    """
     try:
         # Try to get Redis IP from service discovery
-        print("🔍 DEBUG: Attempting to get Redis URL from service discovery...")
-        redis_service_url = get_service_url("redis", 6379)
-        print(f"🔍 DEBUG: Service discovery returned: {redis_service_url}")
+        logger.debug("🔍 Attempting to get Redis IP from service discovery...")
+        redis_ip = get_service_ip("redis")
+        logger.debug("🔍 Service discovery returned: %s", redis_ip)
         
-        if redis_service_url:
-            # Extract IP from the service URL and create Redis URL
-            from urllib.parse import urlparse
-            parsed_url = urlparse(redis_service_url)
-            redis_ip = parsed_url.hostname
+        if redis_ip:
             redis_url = f"redis://{redis_ip}:6379"
-            print(f"🔍 DEBUG: Using Redis URL from service discovery: {redis_url}")
+            logger.debug("🔍 Using Redis URL from service discovery: %s", redis_url)
             return redis_url
         else:
-            print("🔍 DEBUG: Service discovery returned None, using fallback")
+            logger.debug("🔍 Service discovery returned None, using fallback")
     except Exception as e:
-        print(f"⚠️ Failed to get Redis URL from service discovery: {e}")
+        logger.warning("⚠️ Failed to get Redis URL from service discovery: %s", e)
     
     # Fallback to environment variable
     fallback_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-    print(f"🔍 DEBUG: Using fallback Redis URL: {fallback_url}")
+    logger.debug("🔍 Using fallback Redis URL: %s", fallback_url)
     return fallback_url
 
-# Initialize Redis client after service discovery
-redis_client = redis.Redis.from_url(
-    get_redis_url(),
-    decode_responses=True
-)
+def create_redis_client(redis_url: str) -> aioredis.Redis:
+    """Create the Redis client; call from the running loop so its pool binds to it"""
+    return aioredis.from_url(
+        redis_url,
+        decode_responses=True,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        socket_keepalive=True,
+        health_check_interval=30
+    )
+
+async def reconnect_redis():
+    """
+    Look the Redis address up again after a connection error
+    Switches to a new client only if the address changed; otherwise the
+    existing pool reconnects by itself on the next command
+    """
+    get_redis_url.cache_clear()
+    redis_url = get_redis_url()
+    if redis_url == app.state.redis_url:
+        return
+    
+    logger.warning("🔄 Redis address changed to %s, reconnecting", redis_url)
+    old_client = app.state.redis
+    app.state.redis = create_redis_client(redis_url)
+    app.state.redis_url = redis_url
+    await old_client.close()
 
 # Redis storage for notifications (in production, use a database)
-NOTIFICATIONS_KEY = "notifications_db"
+# Notifications live in a hash keyed by ID, indexed by type (sets) and by time (sorted set)
+NOTIFICATIONS_KEY = "notif:all"
+NOTIFICATIONS_BY_TIME_KEY = "notif:ts"
+NOTIFICATION_TYPES_KEY = "notif:types"
+# Running counts maintained on every write and delete, so stats never scan
+NOTIFICATION_COUNT_KEY = "notif:count:total"
+NOTIFICATION_COUNT_BY_TYPE_KEY = "notif:count:by_type"
+# Oldest notifications are trimmed once the store grows past the cap plus some slack
+NOTIFICATIONS_MAX = int(os.getenv("NOTIFICATIONS_MAX", "10000"))
+NOTIFICATIONS_TRIM_SLACK = max(NOTIFICATIONS_MAX // 10, 1)
+
+def notification_type_key(notification_type: str) -> str:
+    """Redis set holding the IDs of all notifications of a type"""
+    return f"notif:type:{notification_type}"
 
 # Pydantic models
 class Notification(BaseModel):
@@ -95,21 +156,14 @@ async def health_check():
 async def get_notifications():
     """Get all notifications from Redis"""
     try:
-        # Get all notifications from Redis
-        notifications = redis_client.lrange(NOTIFICATIONS_KEY, 0, -1)
-        # Parse JSON strings back to dictionaries
-        parsed_notifications = []
-        for notification in notifications:
-            try:
-                parsed_notifications.append(json.loads(notification))
-            except json.JSONDecodeError:
-                continue
-        return {"notifications": parsed_notifications}
+        # Newest first, like the order notifications are displayed in
+        notification_ids = await app.state.redis.zrevrange(NOTIFICATIONS_BY_TIME_KEY, 0, -1)
+        return {"notifications": await load_notifications(notification_ids)}
     except Exception as e:
-        print(f"❌ Error getting notifications from Redis: {e}")
+        logger.error("❌ Error getting notifications from Redis: %s", e)
         return {"notifications": []}
 
-@app.post("/notifications/test")
+@app.post("/notifications/test", response_model=Notification)
 async def send_test_notification(request: TestNotificationRequest):
     """Send a test notification"""
     notification = create_notification(
@@ -119,186 +173,334 @@ async def send_test_notification(request: TestNotificationRequest):
     )
     try:
         # Store notification in Redis
-        notification_dict = notification_to_dict(notification)
-        print(f"🔍 DEBUG: Test notification dict: {notification_dict}")
-        redis_client.lpush(NOTIFICATIONS_KEY, json.dumps(notification_dict))
-        print(f"✅ Test notification stored in Redis: {notification.notification_id}")
+        logger.debug("🔍 Test notification dict: %s", notification)
+        await store_notification(notification)
+        logger.info("✅ Test notification stored in Redis: %s", notification["notification_id"])
     except Exception as e:
-        print(f"❌ Error storing notification in Redis: {e}")
-        import traceback
-        print(f"🔍 DEBUG: Full error traceback: {traceback.format_exc()}")
+        logger.exception("❌ Error storing notification in Redis: %s", e)
     return notification
 
-def create_notification(notification_type: str, message: str, recipient: str) -> Notification:
-    """Helper function to create a notification"""
-    import uuid
-    return Notification(
-        notification_id=str(uuid.uuid4()),
-        type=notification_type,
-        message=message,
-        recipient=recipient,
-        timestamp=datetime.now(),
-        status="sent"
-    )
+async def store_notification(notification_dict: dict):
+    """Store a notification and add it to the type and time indexes"""
+    await store_notifications([notification_dict])
 
-def notification_to_dict(notification: Notification) -> dict:
-    """Convert notification to dictionary with serializable datetime"""
-    notification_dict = notification.dict()
-    # Convert datetime to ISO string for JSON serialization
-    notification_dict["timestamp"] = notification_dict["timestamp"].isoformat()
-    return notification_dict
+async def store_notifications(notifications: List[dict]):
+    """Store a batch of notifications and their index entries in one round-trip"""
+    async with app.state.redis.pipeline(transaction=False) as pipe:
+        for notification_dict in notifications:
+            notification_id = notification_dict["notification_id"]
+            notification_type = notification_dict["type"]
+            pipe.hset(NOTIFICATIONS_KEY, notification_id, orjson.dumps(notification_dict))
+            pipe.sadd(notification_type_key(notification_type), notification_id)
+            pipe.sadd(NOTIFICATION_TYPES_KEY, notification_type)
+            pipe.zadd(NOTIFICATIONS_BY_TIME_KEY, {notification_id: notification_dict["timestamp"].timestamp()})
+            pipe.incr(NOTIFICATION_COUNT_KEY)
+            pipe.hincrby(NOTIFICATION_COUNT_BY_TYPE_KEY, notification_type, 1)
+        # The last INCR reply is the running total after the whole batch
+        stored_count = (await pipe.execute())[-2]
+    
+    if stored_count > NOTIFICATIONS_MAX + NOTIFICATIONS_TRIM_SLACK and not app.state.trim_lock.locked():
+        # Trimming is best-effort; the batch is already stored and must still be acknowledged
+        async with app.state.trim_lock:
+            try:
+                await trim_notifications()
+            except Exception as e:
+                logger.exception("⚠️ Failed to trim old notifications: %s", e)
 
-def process_notification(notification_data: Dict[str, Any]):
+async def trim_notifications():
+    """Delete the oldest notifications so that at most NOTIFICATIONS_MAX remain"""
+    excess = await app.state.redis.zcard(NOTIFICATIONS_BY_TIME_KEY) - NOTIFICATIONS_MAX
+    if excess <= 0:
+        return
+    
+    oldest_ids = await app.state.redis.zrange(NOTIFICATIONS_BY_TIME_KEY, 0, excess - 1)
+    if not oldest_ids:
+        return
+    
+    # Fetch and remove in one MULTI/EXEC, so another replica trimming (or a delete)
+    # cannot claim the same entries; only what this transaction removed is counted down
+    async with app.state.redis.pipeline(transaction=True) as pipe:
+        pipe.hmget(NOTIFICATIONS_KEY, oldest_ids)
+        for notification_id in oldest_ids:
+            pipe.hdel(NOTIFICATIONS_KEY, notification_id)
+        stored, *deleted = await pipe.execute()
+    
+    async with app.state.redis.pipeline(transaction=False) as pipe:
+        pipe.zrem(NOTIFICATIONS_BY_TIME_KEY, *oldest_ids)
+        for notification_id, notification, removed in zip(oldest_ids, stored, deleted):
+            if not removed:
+                continue
+            pipe.decr(NOTIFICATION_COUNT_KEY)
+            try:
+                notification_type = orjson.loads(notification)["type"]
+            except (orjson.JSONDecodeError, KeyError):
+                continue
+            pipe.srem(notification_type_key(notification_type), notification_id)
+            pipe.hincrby(NOTIFICATION_COUNT_BY_TYPE_KEY, notification_type, -1)
+        await pipe.execute()
+    logger.info("🧹 Trimmed %d old notifications from Redis", len(oldest_ids))
+
+async def load_notifications(notification_ids: List[str]) -> List[dict]:
+    """Fetch notifications by ID in one HMGET, skipping missing or malformed entries"""
+    if not notification_ids:
+        return []
+    parsed_notifications = []
+    for notification in await app.state.redis.hmget(NOTIFICATIONS_KEY, notification_ids):
+        if notification is None:
+            continue
+        try:
+            parsed_notifications.append(orjson.loads(notification))
+        except orjson.JSONDecodeError:
+            continue
+    return parsed_notifications
+
+async def process_notifications(batch: List[Dict[str, Any]]):
     """
-    Process incoming notifications from Redis queue
-    This function runs in a separate thread to handle async messages
+    Process a batch of incoming notifications from the Redis stream
+    Builds every notification first, then stores them all in one pipeline
+    
+    Raises:
+        RedisError: If the batch could not be stored
     """
-    try:
+    notifications = []
+    for notification_data in batch:
         notification_type = notification_data.get("type")
-        
-        if notification_type == "order_confirmation":
-            # Process order confirmation notification
-            order_id = notification_data.get("order_id")
-            user_id = notification_data.get("user_id")
-            total_amount = notification_data.get("total_amount")
-            
-            message = f"Order {order_id} confirmed! Total: ${total_amount:.2f}"
-            notification = create_notification(
-                notification_type="order_confirmation",
-                message=message,
-                recipient=user_id
-            )
-            
-            try:
-                # Store notification in Redis
-                notification_dict = notification_to_dict(notification)
-                print(f"🔍 DEBUG: Notification dict: {notification_dict}")
-                redis_client.lpush(NOTIFICATIONS_KEY, json.dumps(notification_dict))
-                print(f"📧 ASYNC: Order confirmation sent to {user_id}: {message}")
-            except Exception as e:
-                print(f"❌ Error storing order confirmation in Redis: {e}")
-                import traceback
-                print(f"🔍 DEBUG: Full error traceback: {traceback.format_exc()}")
-            
-        elif notification_type == "low_stock_alert":
-            # Process low stock alert
-            product_id = notification_data.get("product_id")
-            product_name = notification_data.get("product_name")
-            current_stock = notification_data.get("current_stock")
-            
-            message = f"Low stock alert: {product_name} ({product_id}) - Only {current_stock} units remaining"
-            notification = create_notification(
-                notification_type="low_stock_alert",
-                message=message,
-                recipient="admin@company.com"
-            )
-            
-            try:
-                # Store notification in Redis
-                notification_dict = notification_to_dict(notification)
-                print(f"🔍 DEBUG: Low stock notification dict: {notification_dict}")
-                redis_client.lpush(NOTIFICATIONS_KEY, json.dumps(notification_dict))
-                print(f"⚠️ ASYNC: Low stock alert sent: {message}")
-            except Exception as e:
-                print(f"❌ Error storing low stock alert in Redis: {e}")
-                import traceback
-                print(f"🔍 DEBUG: Full error traceback: {traceback.format_exc()}")
-            
-        elif notification_type == "out_of_stock_alert":
-            # Process out of stock alert
-            product_id = notification_data.get("product_id")
-            product_name = notification_data.get("product_name")
+        handler = HANDLERS.get(notification_type)
+        if handler is None:
+            logger.warning("❓ ASYNC: Unknown notification type: %s", notification_type)
+            continue
+        try:
+            notifications.append(handler(notification_data))
+        except Exception as e:
+            logger.error("❌ ASYNC: Error processing notification: %s", e)
+    
+    if not notifications:
+        return
+    
+    await store_notifications(notifications)
+    for notification in notifications:
+        logger.debug("📧 ASYNC: %s sent to %s: %s", notification["type"], notification["recipient"], notification["message"])
+
+# Messages arrive on a Redis stream read through a consumer group, so each one is
+# handled by a single instance. Entries left unacknowledged by any consumer (a failed
+# batch, or an instance that went away) are claimed again once they have been idle.
+NOTIFICATIONS_STREAM = "notifications"
+NOTIFICATIONS_GROUP = "notification-service"
+NOTIFICATIONS_CONSUMER = os.getenv("HOSTNAME", SERVICE_NAME)
+STREAM_READ_COUNT = 100
+STREAM_BLOCK_MS = 5000
+REDIS_RETRY_DELAY = 1.0  # seconds to wait before reading again after a connection error
+PENDING_MIN_IDLE_MS = 60000  # how long an entry stays unacknowledged before it is claimed
+PENDING_CLAIM_INTERVAL = 30.0  # seconds between scans for idle entries
+
+# Batches read from the stream wait here for a fixed pool of workers
+NOTIFICATION_QUEUE_SIZE = 10
+NOTIFICATION_WORKERS = int(os.getenv("NOTIFICATION_WORKERS", "8"))
+
+async def notification_worker(queue: asyncio.Queue):
+    """
+    Background task that processes queued batches of stream entries
+    A batch is acknowledged only once it is stored; otherwise it stays pending and is replayed
+    """
+    in_flight = app.state.in_flight
+    while True:
+        batch = await queue.get()
+        entry_ids = [entry_id for entry_id, _ in batch]
+        try:
+            await process_notifications([notification_data for _, notification_data in batch])
+            await app.state.redis.xack(NOTIFICATIONS_STREAM, NOTIFICATIONS_GROUP, *entry_ids)
+        except Exception as e:
+            logger.error("❌ ASYNC: Error storing %d notification(s) in Redis: %s", len(entry_ids), e)
+            if isinstance(e, RedisConnectionError):
+                await reconnect_redis()
+        finally:
+            in_flight.difference_update(entry_ids)
+            queue.task_done()
+
+async def create_consumer_group():
+    """Create the consumer group, and the stream with it, unless it already exists"""
+    try:
+        await app.state.redis.xgroup_create(NOTIFICATIONS_STREAM, NOTIFICATIONS_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+async def redis_listener(queue: asyncio.Queue):
+    """
+    Background task that reads the notifications stream as part of the consumer group
+    This demonstrates asynchronous message processing
+    """
+    logger.info("🎧 ASYNC: Notification service listening to Redis stream...")
+    
+    in_flight = app.state.in_flight
+    # Replay entries this consumer read but never acknowledged, then switch to new ones
+    last_id = "0"
+    group_ready = False
+    while True:
+        try:
+            if not group_ready:
+                await create_consumer_group()
+                group_ready = True
             
-            message = f"Out of stock alert: {product_name} ({product_id}) - No units remaining"
-            notification = create_notification(
-                notification_type="out_of_stock_alert",
-                message=message,
-                recipient="admin@company.com"
+            streams = await app.state.redis.xreadgroup(
+                NOTIFICATIONS_GROUP,
+                NOTIFICATIONS_CONSUMER,
+                {NOTIFICATIONS_STREAM: last_id},
+                count=STREAM_READ_COUNT,
+                block=STREAM_BLOCK_MS
             )
+            entries = streams[0][1] if streams else []
             
-            try:
-                # Store notification in Redis
-                notification_dict = notification_to_dict(notification)
-                print(f"🔍 DEBUG: Out of stock notification dict: {notification_dict}")
-                redis_client.lpush(NOTIFICATIONS_KEY, json.dumps(notification_dict))
-                print(f"🚨 ASYNC: Out of stock alert sent: {message}")
-            except Exception as e:
-                print(f"❌ Error storing out of stock alert in Redis: {e}")
-                import traceback
-                print(f"🔍 DEBUG: Full error traceback: {traceback.format_exc()}")
-            
-        else:
-            print(f"❓ ASYNC: Unknown notification type: {notification_type}")
-            
-    except Exception as e:
-        print(f"❌ ASYNC: Error processing notification: {e}")
+            # Entries trimmed from the stream before they were processed come back without fields
+            trimmed_ids = [entry_id for entry_id, notification_data in entries if not notification_data]
+            if trimmed_ids:
+                await app.state.redis.xack(NOTIFICATIONS_STREAM, NOTIFICATIONS_GROUP, *trimmed_ids)
+        except RedisConnectionError as e:
+            logger.warning("⚠️ ASYNC: Lost connection to Redis: %s", e)
+            await reconnect_redis()
+            # The server may have restarted without the group; recreate it and replay
+            group_ready = False
+            last_id = "0"
+            await asyncio.sleep(REDIS_RETRY_DELAY)
+            continue
+        except ResponseError as e:
+            if "NOGROUP" in str(e):
+                group_ready = False
+                continue
+            # e.g. WRONGTYPE if something else took the stream's key; keep retrying
+            logger.exception("❌ ASYNC: Redis rejected the stream read: %s", e)
+            await asyncio.sleep(REDIS_RETRY_DELAY)
+            continue
+        
+        if last_id != ">":
+            last_id = entries[-1][0] if entries else ">"
+        
+        # A replay also returns entries still queued or being stored; those are skipped
+        batch = [
+            (entry_id, notification_data) for entry_id, notification_data in entries
+            if notification_data and entry_id not in in_flight
+        ]
+        if batch:
+            logger.debug("📨 ASYNC: Received %d notification(s)", len(batch))
+            in_flight.update(entry_id for entry_id, _ in batch)
+            # Hand off to the workers; waits here if they fall behind
+            await queue.put(batch)
 
-def redis_listener():
+async def pending_reclaimer(queue: asyncio.Queue):
     """
-    Background thread that listens to Redis notifications channel
-    This demonstrates asynchronous message processing
+    Background task that claims stream entries left unacknowledged for too long
+    Picks up entries from consumers that no longer exist (e.g. a recreated pod with a
+    new HOSTNAME) as well as batches that failed here, and hands them to the workers
     """
-    pubsub = redis_client.pubsub()
-    pubsub.subscribe("notifications")
-    
-    print("🎧 ASYNC: Notification service listening to Redis queue...")
-    
-    for message in pubsub.listen():
-        if message["type"] == "message":
-            try:
-                notification_data = json.loads(message["data"])
-                print(f"📨 ASYNC: Received notification: {notification_data['type']}")
-                
-                # Process notification in a separate thread to avoid blocking
-                thread = threading.Thread(
-                    target=process_notification,
-                    args=(notification_data,)
+    in_flight = app.state.in_flight
+    while True:
+        await asyncio.sleep(PENDING_CLAIM_INTERVAL)
+        start_id = "0-0"
+        try:
+            while True:
+                claimed = await app.state.redis.xautoclaim(
+                    NOTIFICATIONS_STREAM,
+                    NOTIFICATIONS_GROUP,
+                    NOTIFICATIONS_CONSUMER,
+                    min_idle_time=PENDING_MIN_IDLE_MS,
+                    start_id=start_id,
+                    count=STREAM_READ_COUNT
                 )
-                thread.start()
+                start_id, entries = claimed[0], claimed[1]
                 
-            except json.JSONDecodeError as e:
-                print(f"❌ ASYNC: Invalid JSON in notification: {e}")
-            except Exception as e:
-                print(f"❌ ASYNC: Error processing notification: {e}")
+                # Entries trimmed from the stream come back empty; nothing is left to process
+                trimmed_ids = [entry_id for entry_id, notification_data in entries if entry_id and not notification_data]
+                if trimmed_ids:
+                    await app.state.redis.xack(NOTIFICATIONS_STREAM, NOTIFICATIONS_GROUP, *trimmed_ids)
+                
+                batch = [
+                    (entry_id, notification_data) for entry_id, notification_data in entries
+                    if notification_data and entry_id not in in_flight
+                ]
+                if batch:
+                    logger.warning("🔁 ASYNC: Claimed %d idle notification(s)", len(batch))
+                    in_flight.update(entry_id for entry_id, _ in batch)
+                    await queue.put(batch)
+                
+                if start_id == "0-0":
+                    break
+        except RedisConnectionError as e:
+            # The listener reconnects; try again on the next scan
+            logger.warning("⚠️ ASYNC: Failed to claim idle notifications: %s", e)
+        except ResponseError as e:
+            # The listener recreates a missing group; anything else (e.g. no XAUTOCLAIM
+            # before Redis 6.2) is logged and retried on the next scan
+            if "NOGROUP" not in str(e):
+                logger.exception("❌ ASYNC: Failed to claim idle notifications: %s", e)
+
+def log_task_exit(task: asyncio.Task):
+    """Done-callback that logs a background task which stopped because of an error"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("❌ ASYNC: Background task %s stopped", task.get_name(), exc_info=task.exception())
 
 @app.on_event("startup")
 async def startup_event():
-    """Start the Redis listener thread when the service starts"""
-    print("🚀 Starting Notification Service...")
-    thread = threading.Thread(target=redis_listener, daemon=True)
-    thread.start()
-    print("✅ Notification Service started successfully!")
+    """Connect to Redis and start the listener and worker tasks when the service starts"""
+    logger.info("🚀 Starting Notification Service...")
+    start_service_discovery_refresh()
+    # Created on the running loop so the connection pool never blocks it
+    app.state.redis_url = get_redis_url()
+    app.state.redis = create_redis_client(app.state.redis_url)
+    app.state.trim_lock = asyncio.Lock()
+    # IDs of stream entries handed to the workers and not yet acknowledged or failed
+    app.state.in_flight = set()
+    app.state.notification_queue = asyncio.Queue(maxsize=NOTIFICATION_QUEUE_SIZE)
+    app.state.notification_workers = [
+        asyncio.create_task(notification_worker(app.state.notification_queue))
+        for _ in range(NOTIFICATION_WORKERS)
+    ]
+    app.state.redis_listener = asyncio.create_task(redis_listener(app.state.notification_queue))
+    app.state.pending_reclaimer = asyncio.create_task(pending_reclaimer(app.state.notification_queue))
+    for task in (app.state.redis_listener, app.state.pending_reclaimer, *app.state.notification_workers):
+        task.add_done_callback(log_task_exit)
+    logger.info("✅ Notification Service started successfully!")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the listener and workers and close outbound connections when the service stops"""
+    tasks = [app.state.redis_listener, app.state.pending_reclaimer, *app.state.notification_workers]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    
+    await app.state.redis.close()
+    await close_service_discovery()
 
 @app.get("/notifications/stats")
 async def get_notification_stats():
     """Get notification statistics from Redis"""
     try:
-        # Get all notifications from Redis
-        notifications = redis_client.lrange(NOTIFICATIONS_KEY, 0, -1)
+        async with app.state.redis.pipeline(transaction=False) as pipe:
+            pipe.get(NOTIFICATION_COUNT_KEY)
+            pipe.hgetall(NOTIFICATION_COUNT_BY_TYPE_KEY)
+            pipe.zrevrange(NOTIFICATIONS_BY_TIME_KEY, 0, 0)
+            total_notifications, counts_by_type, latest_ids = await pipe.execute()
         
-        # Parse JSON strings back to dictionaries
-        parsed_notifications = []
-        for notification in notifications:
-            try:
-                parsed_notifications.append(json.loads(notification))
-            except json.JSONDecodeError:
-                continue
-        
-        total_notifications = len(parsed_notifications)
+        # Skip types whose notifications have all been deleted
+        type_counts = {
+            notification_type: int(count)
+            for notification_type, count in counts_by_type.items()
+            if int(count) > 0
+        }
         
-        # Count by type
-        type_counts = {}
-        for notification in parsed_notifications:
-            notification_type = notification["type"]
-            type_counts[notification_type] = type_counts.get(notification_type, 0) + 1
+        # Most recent notification from the time index
+        last_notification = None
+        if latest_ids:
+            latest = await load_notifications(latest_ids)
+            last_notification = latest[0] if latest else None
         
         return {
-            "total_notifications": total_notifications,
+            "total_notifications": int(total_notifications or 0),
             "notifications_by_type": type_counts,
-            "last_notification": parsed_notifications[0] if parsed_notifications else None  # Most recent is at index 0
+            "last_notification": last_notification
         }
     except Exception as e:
-        print(f"❌ Error getting notification stats from Redis: {e}")
+        logger.error("❌ Error getting notification stats from Redis: %s", e)
         return {
             "total_notifications": 0,
             "notifications_by_type": {},
@@ -309,56 +511,65 @@ async def get_notification_stats():
 async def get_notifications_by_type(notification_type: str):
     """Get notifications by type from Redis"""
     try:
-        # Get all notifications from Redis
-        notifications = redis_client.lrange(NOTIFICATIONS_KEY, 0, -1)
-        
-        # Parse JSON strings back to dictionaries and filter by type
-        filtered_notifications = []
-        for notification in notifications:
-            try:
-                parsed_notification = json.loads(notification)
-                if parsed_notification["type"] == notification_type:
-                    filtered_notifications.append(parsed_notification)
-            except json.JSONDecodeError:
-                continue
-        
+        notification_ids = list(await app.state.redis.smembers(notification_type_key(notification_type)))
+        filtered_notifications = await load_notifications(notification_ids)
+        # Sets are unordered; return newest first like /notifications
+        filtered_notifications.sort(key=lambda notification: notification["timestamp"], reverse=True)
         return {"notifications": filtered_notifications}
     except Exception as e:
-        print(f"❌ Error getting notifications by type from Redis: {e}")
+        logger.error("❌ Error getting notifications by type from Redis: %s", e)
         return {"notifications": []}
 
 @app.delete("/notifications/{notification_id}")
 async def delete_notification(notification_id: str):
     """Delete a notification from Redis"""
     try:
-        # Get all notifications from Redis
-        notifications = redis_client.lrange(NOTIFICATIONS_KEY, 0, -1)
-        
-        # Find the notification to delete
-        for i, notification in enumerate(notifications):
-            try:
-                parsed_notification = json.loads(notification)
-                if parsed_notification["notification_id"] == notification_id:
-                    # Remove the notification from Redis
-                    redis_client.lrem(NOTIFICATIONS_KEY, 1, notification)
-                    return {"message": f"Notification {notification_id} deleted", "notification": parsed_notification}
-            except json.JSONDecodeError:
-                continue
-        
+        # Fetch and remove in one MULTI/EXEC, so concurrent deletes cannot both claim it
+        async with app.state.redis.pipeline(transaction=True) as pipe:
+            pipe.hget(NOTIFICATIONS_KEY, notification_id)
+            pipe.hdel(NOTIFICATIONS_KEY, notification_id)
+            notification, deleted = await pipe.execute()
+    except Exception as e:
+        logger.error("❌ Error deleting notification from Redis: %s", e)
+        raise HTTPException(status_code=500, detail="Error deleting notification")
+    
+    if not deleted:
         raise HTTPException(status_code=404, detail="Notification not found")
+    
+    try:
+        parsed_notification = orjson.loads(notification)
+        # Only the delete that removed the hash entry updates the indexes and counters
+        async with app.state.redis.pipeline(transaction=False) as pipe:
+            pipe.srem(notification_type_key(parsed_notification["type"]), notification_id)
+            pipe.zrem(NOTIFICATIONS_BY_TIME_KEY, notification_id)
+            pipe.decr(NOTIFICATION_COUNT_KEY)
+            pipe.hincrby(NOTIFICATION_COUNT_BY_TYPE_KEY, parsed_notification["type"], -1)
+            await pipe.execute()
+        return {"message": f"Notification {notification_id} deleted", "notification": parsed_notification}
     except Exception as e:
-        print(f"❌ Error deleting notification from Redis: {e}")
+        logger.error("❌ Error deleting notification from Redis: %s", e)
         raise HTTPException(status_code=500, detail="Error deleting notification")
 
 @app.delete("/notifications")
 async def clear_all_notifications():
     """Clear all notifications from Redis"""
     try:
-        # Delete the notifications key from Redis
-        redis_client.delete(NOTIFICATIONS_KEY)
+        # Delete the notifications hash, all of its indexes and the counters
+        type_keys = [
+            notification_type_key(notification_type)
+            for notification_type in await app.state.redis.smembers(NOTIFICATION_TYPES_KEY)
+        ]
+        await app.state.redis.delete(
+            NOTIFICATIONS_KEY,
+            NOTIFICATIONS_BY_TIME_KEY,
+            NOTIFICATION_TYPES_KEY,
+            NOTIFICATION_COUNT_KEY,
+            NOTIFICATION_COUNT_BY_TYPE_KEY,
+            *type_keys
+        )
         return {"message": "All notifications cleared from Redis"}
     except Exception as e:
-        print(f"❌ Error clearing notifications from Redis: {e}")
+        logger.error("❌ Error clearing notifications from Redis: %s", e)
         raise HTTPException(status_code=500, detail="Error clearing notifications")
 
 if __name__ == "__main__":
@@ -1,20 +1,46 @@
 import os
-import json
 import uuid
+import queue
+import atexit
+import asyncio
+import functools
+import logging
+import logging.handlers
 from datetime import datetime
 from typing import List, Dict, Any
 
-import redis
+import orjson
+import redis.asyncio as aioredis
+from redis.exceptions import ConnectionError as RedisConnectionError
 import httpx
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
 # Import service discovery
-from service_discovery import initialize_service_discovery, get_service_url
+from service_discovery import (
+    initialize_service_discovery,
+    get_service_url,
+    get_service_ip,
+    start_service_discovery_refresh,
+    close_service_discovery
+)
+
+# Log records are written out by a background thread so handlers never block on stderr
+_log_queue = queue.SimpleQueue()
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "WARNING").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
+)
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+atexit.register(_log_listener.stop)
+logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
-app = FastAPI(title="Order Service", version="1.0.0")
+app = FastAPI(title="Order Service", version="1.0.0", default_response_class=ORJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -33,47 +59,81 @@ SERVICE_IP = os.getenv("SERVICE_IP", "localhost")
 # Initialize service discovery
 try:
     initialize_service_discovery(GITHUB_REPO_URL, SERVICE_NAME, SERVICE_IP)
-    print(f"✅ Service discovery initialized for {SERVICE_NAME}")
+    logger.info("✅ Service discovery initialized for %s", SERVICE_NAME)
 except Exception as e:
-    print(f"⚠️ Failed to initialize service discovery: {e}")
+    logger.warning("⚠️ Failed to initialize service discovery: %s", e)
 
 # Redis connection for async communication
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+
+@functools.lru_cache(maxsize=1)
 def get_redis_url():
-    """Get Redis URL from service discovery or environment variable"""
+    """
+    Get Redis URL from service discovery or environment variable
+    Cached; reconnect_redis() clears it to look the address up again
+    """
     try:
         # Try to get Redis IP from service discovery
-        print("🔍 DEBUG: Attempting to get Redis URL from service discovery...")
-        redis_service_url = get_service_url("redis", 6379)
-        print(f"🔍 DEBUG: Service discovery returned: {redis_service_url}")
+        logger.debug("🔍 Attempting to get Redis IP from service discovery...")
+        redis_ip = get_service_ip("redis")
+        logger.debug("🔍 Service discovery returned: %s", redis_ip)
         
-        if redis_service_url:
-            # Extract IP from the service URL and create Redis URL
-            from urllib.parse import urlparse
-            parsed_url = urlparse(redis_service_url)
-            redis_ip = parsed_url.hostname
+        if redis_ip:
             redis_url = f"redis://{redis_ip}:6379"
-            print(f"🔍 DEBUG: Using Redis URL from service discovery: {redis_url}")
+            logger.debug("🔍 Using Redis URL from service discovery: %s", redis_url)
             return redis_url
         else:
-            print("🔍 DEBUG: Service discovery returned None, using fallback")
+            logger.debug("🔍 Service discovery returned None, using fallback")
     except Exception as e:
-        print(f"⚠️ Failed to get Redis URL from service discovery: {e}")
+        logger.warning("⚠️ Failed to get Redis URL from service discovery: %s", e)
     
     # Fallback to environment variable
     fallback_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-    print(f"🔍 DEBUG: Using fallback Redis URL: {fallback_url}")
+    logger.debug("🔍 Using fallback Redis URL: %s", fallback_url)
     return fallback_url
 
-# Initialize Redis client after service discovery
-redis_client = redis.Redis.from_url(
-    get_redis_url(),
-    decode_responses=True
-)
+def create_redis_client(redis_url: str) -> aioredis.Redis:
+    """Create the Redis client; call from the running loop so its pool binds to it"""
+    return aioredis.from_url(
+        redis_url,
+        decode_responses=True,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        socket_keepalive=True,
+        health_check_interval=30
+    )
+
+async def reconnect_redis():
+    """
+    Look the Redis address up again after a connection error
+    Switches to a new client only if the address changed; otherwise the
+    existing pool reconnects by itself on the next command
+    """
+    get_redis_url.cache_clear()
+    redis_url = get_redis_url()
+    if redis_url == app.state.redis_url:
+        return
+    
+    logger.warning("🔄 Redis address changed to %s, reconnecting", redis_url)
+    old_client = app.state.redis
+    app.state.redis = create_redis_client(redis_url)
+    app.state.redis_url = redis_url
+    await old_client.close()
 
 # Fallback URLs for synchronous communication (used if service discovery fails)
 # INVENTORY_SERVICE_URL = os.getenv("INVENTORY_SERVICE_URL", "http://localhost:8002")
 # NOTIFICATION_SERVICE_URL = os.getenv("NOTIFICATION_SERVICE_URL", "http://localhost:8003")
 
+# Order confirmations are added to the notifications stream as flat fields
+NOTIFICATIONS_STREAM = "notifications"
+NOTIFICATIONS_STREAM_MAXLEN = 10000
+
+# Shared client for calls to the inventory service, so connections are reused across orders
+http_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    timeout=5.0
+)
+
 # In-memory storage for orders (in production, use a database)
 orders_db = {}
 
@@ -94,6 +154,21 @@ class Order(BaseModel):
     total_amount: float
     created_at: datetime
 
+@app.on_event("startup")
+async def startup_event():
+    """Connect to Redis and start refreshing service discovery in the background"""
+    start_service_discovery_refresh()
+    # Created on the running loop so the connection pool never blocks it
+    app.state.redis_url = get_redis_url()
+    app.state.redis = create_redis_client(app.state.redis_url)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close outbound connections when the service stops"""
+    await app.state.redis.close()
+    await http_client.aclose()
+    await close_service_discovery()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -121,73 +196,75 @@ async def create_order(order_request: CreateOrderRequest):
     """
     order_id = str(uuid.uuid4())
     
-    print(f"🛒 Creating order {order_id} for user {order_request.user_id}")
+    logger.debug("🛒 Creating order %s for user %s", order_id, order_request.user_id)
     
     # Step 1: Synchronous communication - Check inventory
-    print("📞 SYNC: Checking inventory availability...")
+    logger.debug("📞 SYNC: Checking inventory availability...")
     
     # Get inventory service URL dynamically
     inventory_url = get_service_url("inventory-service", 8002) or INVENTORY_SERVICE_URL
-    print(f"🔗 Using inventory service URL: {inventory_url}")
+    logger.debug("🔗 Using inventory service URL: %s", inventory_url)
     
-    async with httpx.AsyncClient() as client:
-        try:
-            # Check each product's availability
-            for item in order_request.items:
-                response = await client.get(
-                    f"{inventory_url}/products/{item.product_id}"
+    try:
+        # Fetch each distinct product once; lines for the same product share its stock
+        quantities: Dict[str, int] = {}
+        for item in order_request.items:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+        product_ids = list(quantities)
+        
+        responses = await asyncio.gather(*(
+            http_client.get(f"{inventory_url}/products/{product_id}")
+            for product_id in product_ids
+        ))
+        products: Dict[str, Dict[str, Any]] = {}
+        for product_id, response in zip(product_ids, responses):
+            if response.status_code != 200:
+                raise HTTPException(
+                    status_code=400, 
+                    detail=f"Product {product_id} not found"
                 )
-                if response.status_code != 200:
-                    raise HTTPException(
-                        status_code=400, 
-                        detail=f"Product {item.product_id} not found"
-                    )
-                
-                product_data = response.json()
-                if product_data["stock"] < item.quantity:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Insufficient stock for product {item.product_id}"
-                    )
-            
-            print("✅ SYNC: Inventory check successful")
             
-            # Step 2: Synchronous communication - Update inventory
-            print("📞 SYNC: Updating inventory...")
-            for item in order_request.items:
-                response = await client.put(
-                    f"{inventory_url}/products/{item.product_id}/stock",
-                    json={"quantity": -item.quantity}  # Reduce stock
+            product_data = orjson.loads(response.content)
+            if product_data["stock"] < quantities[product_id]:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Insufficient stock for product {product_id}"
                 )
-                if response.status_code != 200:
-                    raise HTTPException(
-                        status_code=500,
-                        detail=f"Failed to update inventory for product {item.product_id}"
-                    )
-            
-            print("✅ SYNC: Inventory updated successfully")
-            
-            # Step 3: Calculate total amount using real prices from inventory
-            print("💰 SYNC: Calculating total amount with real prices...")
-            total_amount = 0.0
-            for item in order_request.items:
-                # Get product details to get the real price
-                response = await client.get(f"{inventory_url}/products/{item.product_id}")
-                if response.status_code == 200:
-                    product_data = response.json()
-                    item_total = item.quantity * product_data["price"]
-                    total_amount += item_total
-                    print(f"💰 Product {item.product_id}: {item.quantity} x ${product_data['price']} = ${item_total}")
-                else:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Failed to get price for product {item.product_id}"
-                    )
-            
-            print(f"💰 Total amount: ${total_amount}")
-            
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=503, detail=f"Inventory service unavailable: {str(e)}")
+            products[product_id] = product_data
+        
+        logger.debug("✅ SYNC: Inventory check successful")
+        
+        # Step 2: Synchronous communication - Update inventory
+        logger.debug("📞 SYNC: Updating inventory...")
+        responses = await asyncio.gather(*(
+            http_client.put(
+                f"{inventory_url}/products/{product_id}/stock",
+                json={"quantity": -quantity}  # Reduce stock
+            )
+            for product_id, quantity in quantities.items()
+        ))
+        for product_id, response in zip(product_ids, responses):
+            if response.status_code != 200:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Failed to update inventory for product {product_id}"
+                )
+        
+        logger.debug("✅ SYNC: Inventory updated successfully")
+        
+        # Step 3: Calculate total amount using the real prices fetched in step 1
+        logger.debug("💰 SYNC: Calculating total amount with real prices...")
+        total_amount = 0.0
+        for item in order_request.items:
+            price = products[item.product_id]["price"]
+            item_total = item.quantity * price
+            total_amount += item_total
+            logger.debug("💰 Product %s: %d x $%s = $%s", item.product_id, item.quantity, price, item_total)
+        
+        logger.debug("💰 Total amount: $%s", total_amount)
+        
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=503, detail=f"Inventory service unavailable: {str(e)}")
     
     # Create order object
     order = Order(
@@ -203,24 +280,31 @@ async def create_order(order_request: CreateOrderRequest):
     orders_db[order_id] = order.dict()
     
     # Step 4: Asynchronous communication - Send order confirmation
-    print("📨 ASYNC: Sending order confirmation notification...")
+    logger.debug("📨 ASYNC: Sending order confirmation notification...")
     notification_message = {
         "type": "order_confirmation",
         "order_id": order_id,
         "user_id": order_request.user_id,
         "total_amount": total_amount,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": order.created_at.isoformat()
     }
     
     try:
-        # Publish to Redis queue for async processing
-        redis_client.publish("notifications", json.dumps(notification_message))
-        print("✅ ASYNC: Order confirmation notification queued")
+        # Add to the Redis stream for async processing
+        await app.state.redis.xadd(
+            NOTIFICATIONS_STREAM,
+            notification_message,
+            maxlen=NOTIFICATIONS_STREAM_MAXLEN,
+            approximate=True
+        )
+        logger.debug("✅ ASYNC: Order confirmation notification queued")
     except Exception as e:
-        print(f"⚠️ ASYNC: Failed to queue notification: {e}")
+        logger.warning("⚠️ ASYNC: Failed to queue notification: %s", e)
+        if isinstance(e, RedisConnectionError):
+            await reconnect_redis()
         # Don't fail the order creation if notification fails
     
-    print(f"🎉 Order {order_id} created successfully!")
+    logger.debug("🎉 Order %s created successfully!", order_id)
     return order
 
 @app.get("/orders/{order_id}/status")
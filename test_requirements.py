@@ -1,78 +1,453 @@
 #!/usr/bin/env python3
 """
-Test script to verify requirements.txt is valid
+Test script to verify the requirements files are valid
 """
 
-import subprocess
 import sys
-import tempfile
 import os
 
-def test_requirements():
-    """Test if requirements.txt can be installed"""
-    print("🧪 Testing requirements.txt...")
+# Downloaded packages and metadata are kept between runs
+CACHE_DIR = os.path.expanduser(os.path.join('~', '.cache', 'reqtest'))
+
+# Files that already passed on this interpreter and platform are not checked again
+VALIDATED_CACHE = os.path.join(CACHE_DIR, 'validated.json')
+
+# Only the end of the resolver output is kept; errors are reported there
+OUTPUT_TAIL_LINES = 200
+ERROR_PREFIXES = ('ERROR', 'error:')
+
+# pip explains a conflict after its first error line ("The conflict is caused by: ...");
+# this many further lines are kept, up to its closing ResolutionImpossible line
+ERROR_CONTEXT_LINES = 50
+FINAL_ERROR_PREFIX = 'ERROR: ResolutionImpossible'
+
+# Set REQTEST_PYTHONS to extra interpreters to resolve for, as versions ("3.11") or
+# paths separated by spaces or commas, to exercise markers like python_version < '3.11'.
+# By default only the interpreter running this script is used, matching the images.
+EXTRA_PYTHONS = os.environ.get('REQTEST_PYTHONS', '').replace(',', ' ').split()
+
+# Set REQTEST_ONLY_BINARY=1 to also require a wheel for every package on this platform
+ONLY_BINARY = os.environ.get('REQTEST_ONLY_BINARY', '').lower() in ('1', 'true', 'yes')
+
+def run_streaming(command, env):
+    """
+    Run a resolver command, keeping only the tail of its output
+    The command is stopped shortly after it reports an error, once the
+    explanation that follows has been read
+    
+    Args:
+        command: Command line to run
+        env: Environment for the command
+    
+    Returns:
+        Tuple of the exit code and the last lines of combined stdout/stderr
+    """
+    import collections
+    import subprocess
+    
+    tail = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+    with subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, env=env
+    ) as process:
+        context_left = None
+        for line in process.stdout:
+            tail.append(line)
+            if context_left is None:
+                if line.startswith(ERROR_PREFIXES):
+                    context_left = ERROR_CONTEXT_LINES
+                continue
+            context_left -= 1
+            if line.startswith(FINAL_ERROR_PREFIX) or context_left <= 0:
+                process.terminate()
+                break
+    return process.returncode, ''.join(tail)
+
+def write_log(log):
+    """
+    Write collected messages to stdout in one call, so output from parallel
+    workers is not interleaved line by line
+    
+    Args:
+        log: Messages to write, one per line
+    """
+    if log:
+        sys.stdout.write('\n'.join(log) + '\n')
+        sys.stdout.flush()
+
+# Requirement lines pip accepts that are not PEP 508 strings: local paths and archives,
+# URLs (including VCS URLs such as git+https://...) and ${VAR} substitutions
+ARCHIVE_SUFFIXES = ('.whl', '.zip', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.tar')
+
+def is_path_or_url(requirement):
+    """
+    Tell if a requirement line names a path or URL rather than a PEP 508 requirement
+    
+    Args:
+        requirement: Requirement line without comments and options
+    
+    Returns:
+        True if the line is left for the resolver to interpret
+    """
+    import re
+    
+    target = re.split(r'[\s;]', requirement, 1)[0]
+    return (
+        '${' in requirement
+        or target.startswith(('.', '~'))
+        or '/' in target or '\\' in target
+        or target.lower().endswith(ARCHIVE_SUFFIXES)
+        # URL schemes (https:, git+ssh:, file:) and Windows drive letters
+        or re.match(r'[A-Za-z][\w+.-]*:', target) is not None
+    )
+
+def check_syntax(req_path, log):
+    """
+    Parse every requirement line before any resolver runs, so typos fail fast
+    Option lines (-r, -e, --index-url, ...), per-requirement options (--hash, ...)
+    and path or URL lines are left for the resolver
+    
+    Args:
+        req_path: Path of the requirements file
+        log: List the error messages are appended to
+    
+    Returns:
+        True if every requirement line parses (or no parser is available)
+    """
+    import re
     
     try:
-        # Read requirements file
-        with open('requirements.txt', 'r') as f:
+        from packaging.requirements import Requirement, InvalidRequirement
+    except ImportError:
+        try:
+            from pip._vendor.packaging.requirements import Requirement, InvalidRequirement
+        except ImportError:
+            return True
+    
+    with open(req_path, 'r') as f:
+        # Join backslash continuations, keeping the number of the line each requirement starts on
+        lines = []
+        pending, start = '', 0
+        for lineno, raw in enumerate(f, 1):
+            line = raw.rstrip('\n')
+            if not pending:
+                start = lineno
+            if line.endswith('\\'):
+                pending += line[:-1]
+                continue
+            lines.append((start, pending + line))
+            pending = ''
+        if pending:
+            lines.append((start, pending))
+    
+    valid = True
+    for lineno, line in lines:
+        # Comments start at a '#' at the beginning of the line or after whitespace
+        requirement = re.sub(r'(^|\s)#.*$', '', line).strip()
+        # Per-requirement options such as --hash=sha256:... follow the requirement itself
+        requirement = re.split(r'\s--?[A-Za-z]', requirement, 1)[0].strip()
+        if not requirement or requirement.startswith('-') or is_path_or_url(requirement):
+            continue
+        try:
+            Requirement(requirement)
+        except InvalidRequirement as e:
+            log.append(f"❌ {req_path}:{lineno}: {e}")
+            valid = False
+    return valid
+
+def find_interpreters():
+    """
+    Find the Python interpreters to resolve the requirements for
+    
+    Returns:
+        Paths of the interpreters, starting with the one running this script
+    
+    Raises:
+        ValueError: If a requested interpreter is missing, or cannot run pip when uv is unavailable
+    """
+    import shutil
+    import subprocess
+    
+    check_pip = shutil.which('uv') is None
+    pythons = [sys.executable]
+    seen = {os.path.realpath(sys.executable)}
+    for requested in EXTRA_PYTHONS:
+        is_path = os.sep in requested or (os.altsep is not None and os.altsep in requested)
+        python = shutil.which(requested if is_path else f'python{requested}')
+        if not python:
+            raise ValueError(f"Python interpreter {requested} not found")
+        if os.path.realpath(python) in seen:
+            continue
+        seen.add(os.path.realpath(python))
+        if check_pip and subprocess.run([python, '-c', 'import pip'], capture_output=True).returncode != 0:
+            raise ValueError(f"{python} cannot import pip and uv is not installed")
+        pythons.append(python)
+    return pythons
+
+def resolve(req_paths, log, python=sys.executable):
+    """
+    Resolve one or more requirements files together without installing anything
+    
+    Args:
+        req_paths: Paths of the requirements files
+        log: List progress messages are appended to
+        python: Interpreter to resolve for
+    
+    Returns:
+        Tuple of the resolver's exit code and the tail of its output
+    """
+    # Imported here so importing this module stays cheap
+    import shutil
+    import tempfile
+    
+    env = os.environ.copy()
+    env['PIP_CACHE_DIR'] = os.path.join(CACHE_DIR, 'pip')
+    env['UV_CACHE_DIR'] = os.path.join(CACHE_DIR, 'uv')
+    
+    # Wheel-only resolution never falls back to building an sdist
+    binary_args = ['--only-binary', ':all:'] if ONLY_BINARY else []
+    
+    # uv resolves much faster than pip
+    uv_path = shutil.which('uv')
+    if uv_path:
+        log.append("⚡ Resolving with uv")
+        # Resolution only: prints the pinned set without creating an environment
+        return run_streaming([
+            uv_path, 'pip', 'compile', '--quiet', '--python', python, *binary_args, *req_paths
+        ], env)
+    
+    # --target keeps resolution independent of what this interpreter has installed
+    with tempfile.TemporaryDirectory() as temp_dir:
+        requirement_args = [arg for req_path in req_paths for arg in ('-r', req_path)]
+        return run_streaming([
+            python, '-m', 'pip', 'install', '--dry-run', '--ignore-installed',
+            '--prefer-binary', '--disable-pip-version-check', *binary_args,
+            '--target', temp_dir, *requirement_args
+        ], env)
+
+def validate_one(req_path, python=sys.executable):
+    """
+    Test if a requirements file resolves to an installable set of packages
+    The caller has already checked the file's syntax
+    
+    Args:
+        req_path: Path of the requirements file
+        python: Interpreter to resolve for
+    
+    Returns:
+        True if the requirements resolve
+    """
+    log = [f"🧪 Testing {req_path} with {python}..."]
+    
+    try:
+        with open(req_path, 'r') as f:
             requirements = f.read().strip()
-        
-        print(f"📋 Requirements found:\n{requirements}")
-        
-        # Create a temporary virtual environment
-        with tempfile.TemporaryDirectory() as temp_dir:
-            print(f"🔧 Creating temporary environment in {temp_dir}")
-            
-            # Create virtual environment
-            subprocess.run([
-                sys.executable, '-m', 'venv', os.path.join(temp_dir, 'venv')
-            ], check=True)
-            
-            # Activate virtual environment and install requirements
-            if os.name == 'nt':  # Windows
-                pip_path = os.path.join(temp_dir, 'venv', 'Scripts', 'pip')
-            else:  # Unix/Linux
-                pip_path = os.path.join(temp_dir, 'venv', 'bin', 'pip')
-            
-            # Install requirements
-            result = subprocess.run([
-                pip_path, 'install', '-r', 'requirements.txt'
-            ], capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                print("✅ Requirements installed successfully!")
-                
-                # List installed packages
-                list_result = subprocess.run([
-                    pip_path, 'list'
-                ], capture_output=True, text=True)
-                
-                print("📦 Installed packages:")
-                print(list_result.stdout)
-                
-            else:
-                print("❌ Failed to install requirements:")
-                print(result.stderr)
-                return False
-                
-    except FileNotFoundError:
-        print("❌ requirements.txt not found")
-        return False
-    except Exception as e:
-        print(f"❌ Error testing requirements: {e}")
+    except OSError as e:
+        log.append(f"❌ Error reading {req_path}: {e}")
+        write_log(log)
         return False
     
-    return True
+    log.append(f"📋 Requirements found:\n{requirements}")
+    
+    returncode, output = resolve([req_path], log, python)
+    if returncode == 0:
+        log.append("✅ Requirements resolved successfully!")
+        log.append("📦 Resolved packages:")
+    else:
+        log.append(f"❌ Failed to resolve {req_path} with {python}:")
+    log.append(output)
+    write_log(log)
+    return returncode == 0
+
+def validation_key(req_path, pythons):
+    """
+    Key under which a successful validation of a requirements file is cached
+    
+    Args:
+        req_path: Path to the requirements file
+        pythons: Interpreters the file is resolved for
+    
+    Returns:
+        SHA-256 hex digest of the file contents, Python version, platform,
+        interpreters and wheel-only mode
+    """
+    import hashlib
+    import platform
+    
+    with open(req_path, 'rb') as f:
+        contents = f.read()
+    mode = b'only-binary' if ONLY_BINARY else b''
+    interpreters = '\0'.join(pythons).encode()
+    return hashlib.sha256(
+        contents + sys.version.encode() + platform.platform().encode() + interpreters + mode
+    ).hexdigest()
+
+def load_validated():
+    """
+    Load the keys of previously validated requirements files
+    
+    Returns:
+        Mapping of validation key to True (empty if there is no usable cache)
+    """
+    import json
+    
+    try:
+        with open(VALIDATED_CACHE) as f:
+            validated = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return validated if isinstance(validated, dict) else {}
+
+def save_validated(validated):
+    """
+    Write the validation cache atomically so concurrent runs never see a partial file
+    
+    Args:
+        validated: Mapping of validation key to True
+    """
+    import json
+    import tempfile
+    
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(validated, f)
+        os.replace(tmp_path, VALIDATED_CACHE)
+    except OSError as e:
+        print(f"⚠️ Could not write validation cache: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+def check_requirements(req_paths, pythons=None):
+    """
+    Validate several requirements files
+    Files unchanged since their last successful validation are skipped; the
+    rest are syntax-checked and then resolved
+    
+    Args:
+        req_paths: Paths of the requirements files
+        pythons: Interpreters to resolve for (only the running one if omitted)
+    
+    Returns:
+        Mapping of each path to whether it is valid
+    """
+    pythons = pythons or [sys.executable]
+    results = {}
+    log = [f"🐍 Resolving for {', '.join(pythons)}"]
+    validated = load_validated()
+    keys = {}
+    for req_path in req_paths:
+        try:
+            keys[req_path] = validation_key(req_path, pythons)
+            if keys[req_path] in validated:
+                log.append(f"✅ {req_path} unchanged since last successful validation")
+                results[req_path] = True
+            # Files with syntax errors fail without reaching the resolver
+            elif not check_syntax(req_path, log):
+                results[req_path] = False
+        except OSError as e:
+            log.append(f"❌ Error reading {req_path}: {e}")
+            results[req_path] = False
+    write_log(log)
+    req_paths = [req_path for req_path in req_paths if req_path not in results]
+    if not req_paths:
+        return results
+    
+    results.update(resolve_all(req_paths, pythons))
+    
+    passed = [req_path for req_path in req_paths if results[req_path]]
+    if passed:
+        validated.update((keys[req_path], True) for req_path in passed)
+        save_validated(validated)
+    return results
+
+def resolve_together(req_paths, python):
+    """
+    Resolve several requirements files in one resolver run
+    
+    Args:
+        req_paths: Paths of the requirements files
+        python: Interpreter to resolve for
+    
+    Returns:
+        True if the files resolve together
+    """
+    log = [f"🧪 Resolving {len(req_paths)} requirements files together with {python}..."]
+    returncode, output = resolve(req_paths, log, python)
+    if returncode == 0:
+        log.append("✅ Requirements resolved successfully!")
+        log.append("📦 Resolved packages:")
+        log.append(output)
+    else:
+        log.append(f"⚠️ Combined resolution failed with {python}, checking each file separately")
+    write_log(log)
+    return returncode == 0
+
+def resolve_all(req_paths, pythons):
+    """
+    Resolve requirements files that passed the syntax check, for each interpreter concurrently
+    All files are first resolved together in one resolver run; only if that
+    fails is each file checked on its own to find the culprits
+    
+    Args:
+        req_paths: Paths of the requirements files
+        pythons: Interpreters to resolve for
+    
+    Returns:
+        Mapping of each path to whether it resolved for every interpreter
+    """
+    import itertools
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    
+    results = dict.fromkeys(req_paths, True)
+    
+    # Workers fork from a small, already-started server process instead of this one
+    mp_context = multiprocessing.get_context('forkserver') if sys.platform != 'win32' else None
+    
+    workers = min(len(req_paths) * len(pythons), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+        failing = pythons
+        if len(req_paths) > 1:
+            resolved = executor.map(resolve_together, itertools.repeat(req_paths), pythons)
+            failing = [python for python, ok in zip(pythons, resolved) if not ok]
+        
+        jobs = [(req_path, python) for python in failing for req_path in req_paths]
+        outcomes = executor.map(validate_one, [job[0] for job in jobs], [job[1] for job in jobs])
+        for (req_path, _), ok in zip(jobs, outcomes):
+            if not ok:
+                results[req_path] = False
+    return results
 
 def main():
-    print("🔍 Testing requirements.txt validity...")
+    import pathlib
+    
+    # Look next to this script rather than in whatever directory it was started from;
+    # stat each match now so only real files reach the resolver
+    root = pathlib.Path(__file__).resolve().parent
+    req_paths = sorted(str(path) for path in root.glob(os.path.join('**', 'requirements*.txt')) if path.is_file())
+    if not req_paths:
+        print("❌ No requirements files found")
+        sys.exit(1)
+    
+    try:
+        pythons = find_interpreters()
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    
+    print(f"🔍 Testing validity of {len(req_paths)} requirements file(s)...")
+    results = check_requirements(req_paths, pythons)
+    failed = [req_path for req_path, valid in results.items() if not valid]
     
-    if test_requirements():
+    if not failed:
         print("\n✅ All requirements are valid!")
         print("🚀 Ready for Docker builds")
     else:
         print("\n❌ Requirements test failed!")
-        print("🔧 Please fix the requirements.txt file")
+        print(f"🔧 Please fix: {', '.join(failed)}")
         sys.exit(1)
 
 if __name__ == "__main__":